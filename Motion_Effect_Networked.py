@@ -29,11 +29,20 @@ import socket
 import time
 import math
 import logging 
+import collections
+import asyncio
+import struct
+import copy
+
+try:
+    import numpy as np
+except ImportError:
+    # Motion falls back to a per-source loop without NumPy.
+    np = None
 
 source_name = ""
 visible = True
 animationCount = 0
-scene_item = None
 settings = []
 props = obs.obs_properties_create()
 
@@ -48,10 +57,119 @@ MOVEMENT_SPEED = (1<<0)
 MOVEMENT_DURATION = (1<<1)
 MOVEMENT_QUICKEST = MOVEMENT_SPEED | MOVEMENT_DURATION
 
+# Scene an animation's item is looked up in.
+TARGET_PROGRAM = 0
+TARGET_PREVIEW = 1
+TARGET_SCENE = 2
+TARGET_ALL = 3
+
+EDGE_NONE = 0
+EDGE_STOP = 1
+EDGE_BOUNCE = 2
+EDGE_WRAP = 3
+
+EASING_LINEAR = 0
+EASING_IN_QUAD = 1
+EASING_OUT_QUAD = 2
+EASING_IN_OUT_QUAD = 3
+EASING_IN_CUBIC = 4
+EASING_OUT_CUBIC = 5
+EASING_IN_OUT_CUBIC = 6
+EASING_IN_EXPO = 7
+EASING_OUT_EXPO = 8
+EASING_IN_OUT_EXPO = 9
+EASING_IN_BACK = 10
+EASING_OUT_BACK = 11
+EASING_IN_OUT_BACK = 12
+EASING_OUT_ELASTIC = 13
+EASING_OUT_BOUNCE = 14
+EASING_CUBIC_BEZIER = 15
+# Samples per easing lookup table; each table holds EasingTableSize + 1 points.
+EasingTableSize = 256
+
+DISPATCH_START = 0
+DISPATCH_STOP = 1
+
+CommandQueueCapacity = 256
+DatagramSize = 1024
+ReceiveBatchSize = 64
+# Upper bound on batches drained per wakeup so a flood can't starve a stop request.
+ReceiveBatchesPerWakeup = 16
+WSAEMSGSIZE = 10040
+
+# Binary commands share the port with text commands. A binary datagram starts
+# with BINARY_MAGIC, which can never begin a UTF-8 text command:
+#   magic:u8 version:u8 opcode:u8 paramMask:u8 animationIndex:u16
+# followed by one little-endian float32 per bit set in paramMask, lowest bit first.
+# An OPCODE_BATCH frame reuses the header with animationIndex holding a frame
+# count, followed by that many (length:u16, frame) pairs.
+# OPCODE_START_ITEM and OPCODE_STOP_ITEM carry sceneItemId:u32 right after the
+# header and address that item of the animation's target scene instead of the
+# configured one. Ids with no item in that scene are rejected.
+# Text datagrams may carry several newline-delimited commands.
+# Every command in one datagram is applied on the same tick.
+BINARY_MAGIC = 0xA5
+BINARY_VERSION = 1
+
+OPCODE_START = 1
+OPCODE_STOP = 2
+OPCODE_BATCH = 3
+OPCODE_START_ITEM = 4
+OPCODE_STOP_ITEM = 5
+
+PARAM_DESTINATION_X = (1<<0)
+PARAM_DESTINATION_Y = (1<<1)
+PARAM_DESTINATION_WIDTH = (1<<2)
+PARAM_DESTINATION_HEIGHT = (1<<3)
+PARAM_DURATION = (1<<4)
+PARAM_SPEED = (1<<5)
+PARAM_DIRECTION = (1<<6)
+PARAM_EASING = (1<<7)
+
+# Animation attribute overridden by each parameter bit, in wire order.
+BinaryParameters = [
+    (PARAM_DESTINATION_X, "destinationX"),
+    (PARAM_DESTINATION_Y, "destinationY"),
+    (PARAM_DESTINATION_WIDTH, "destinationWidth"),
+    (PARAM_DESTINATION_HEIGHT, "destinationHeight"),
+    (PARAM_DURATION, "duration"),
+    (PARAM_SPEED, "posSpeed"),
+    (PARAM_DIRECTION, "posDirection"),
+    (PARAM_EASING, "easing"),
+]
+# Parameters that select something by index rather than carry a measurement,
+# with the number of valid indices.
+BinaryIntegerParameters = {"posDirection": 8, "easing": EASING_CUBIC_BEZIER + 1}
+# Smallest value the properties UI allows for measurements that set a rate.
+BinaryParameterMinimums = {"duration": 0, "posSpeed": 1}
+BinaryHeader = struct.Struct("<BBBBH")
+BinaryFrameLength = struct.Struct("<H")
+BinarySceneItemId = struct.Struct("<I")
+
 DefaultUpdatePerSecond = 60
 UpdatesPerSecond = 60
 TickFactor = DefaultUpdatePerSecond / UpdatesPerSecond
 UpdateRateMs = int(1000/UpdatesPerSecond)
+# Rate (fraction of a move per second) for moves that have nothing to cover.
+InstantRate = 1e9
+# A spring comes to rest once it is this close to its goal and this slow.
+SpringRestDistance = 0.5
+SpringRestSpeed = 1.0
+SpringRestScale = 1e-4
+SpringRestScaleSpeed = 1e-3
+# OBS keeps transforms as 32-bit floats, so a transform this close to the one
+# we wrote is our own write coming back.
+EchoTolerance = 1e-3
+tickFollowsCanvas = False
+tickFollowsCanvasStorage = "tickFollowsCanvasStorage"
+# Animation whose properties the script dialog builds, or all of them.
+EDIT_ALL_ANIMATIONS = -1
+editAnimation = 0
+editAnimationStorage = "editAnimationStorage"
+# Animations whose properties exist in the open dialog.
+builtAnimations = set()
+# Monotonic time of the previous tick that moved something, None while idle.
+lastTickTime = None
 Animations = [] # type: List[Animation] 
 source_pos = obs.vec2()
 
@@ -60,77 +178,159 @@ class ServerClass:
         self.address = "localhost"
         self.port = "12345"
 
+        self.batchedReceive = False
+        self.receiveBufferKB = 0
+
         self.addressStorage = "addressStorage"
         self.portStorage = "portStorage"
+        self.batchedReceiveStorage = "batchedReceiveStorage"
+        self.receiveBufferStorage = "receiveBufferStorage"
         self.thread = None
+        self.loop = None
+
+        # Receive ring, reused for every datagram. Each slot has one spare byte so an oversized datagram is detectable.
+        self.ring = [bytearray(DatagramSize + 1) for _ in range(ReceiveBatchSize)]
+        self.ringViews = [memoryview(buffer) for buffer in self.ring]
+        self.ringLengths = [0] * ReceiveBatchSize
+        self.overflowCount = 0
 
         self.run = False
         # If Ping time exceed
-        self.lastPingTime = time.clock()
+        self.lastPingTime = time.monotonic()
         self.closeIfNoPingInXSeconds = 8
         self.threadId = 0
-        self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socketClosed = True
 
     def checkServer(self):
         if self.thread == None:
             self.createServerThread()
         elif not self.run:
+            self.stopServer()
             self.createServerThread()
 
     def createServerThread(self):
         print("Checking the Server")
         self.run = True
-        self.thread = threading.Thread(target=self.serverThread, args=(Animations,))
+        self.lastPingTime = time.monotonic()
+        # A selector loop works the same on every platform, the Windows proactor loop does not.
+        self.loop = asyncio.SelectorEventLoop()
+        self.thread = threading.Thread(target=self.serverThread, args=(self.loop,), daemon=True)
         self.thread.start()
         self.threadId = self.thread.ident
         print('Creating thread with name %s, id %s' % (self.thread.getName(), self.thread.ident))
 
-    def serverThread(self, animations):
-        
-        self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        
+    def serverThread(self, loop):
+        asyncio.set_event_loop(loop)
+        serverSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
         # Attempt to bind the socket to an address and port.
         try:
-            self.serverSocket.bind((Server.address, Server.port))
-        except socket.error:
+            if self.receiveBufferKB > 0:
+                serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receiveBufferKB * 1024)
+            serverSocket.setblocking(False)
+            serverSocket.bind((self.address, self.port))
+            if self.batchedReceive:
+                loop.add_reader(serverSocket.fileno(), self.drainSocket, serverSocket)
+            else:
+                loop.add_reader(serverSocket.fileno(), self.receiveDatagram, serverSocket)
+        except (OSError, RuntimeError) as e:
             # If we come across an error, shut down the server thread so another one can be made.
+            print("Server failed to bind: %s" % (e))
             self.run = False
-        print("Starting the Server")
-        self.serverSocket.settimeout(2)
-        while self.run:
-            try:
-                data = None
-                addr = None
-                data, addr = self.serverSocket.recvfrom(1024)
-                decodedData = "".join(map(chr, data))
-                print("Message: ", decodedData)
-                if decodedData != None and decodedData != "":
-                    ProcessCommand(decodedData, animations)
-            except socket.timeout: # fail after 1 second of no activity
-                test = 0
-            except:
-                print("Socket failed to receive. Socket could be closed or program is existing.")
-                self.run = False
-                break
-            if(time.clock() - self.lastPingTime) >= self.closeIfNoPingInXSeconds:
-                print("Closing server due to ping not received.")
-                self.run = False
+
+        listening = self.run
+        if listening:
+            print("Starting the Server")
+            loop.call_later(self.closeIfNoPingInXSeconds, self.checkPing, loop)
+            # Sleeps until a datagram arrives or stopServer wakes the loop.
+            loop.run_forever()
+
+        if listening:
+            loop.remove_reader(serverSocket.fileno())
+        serverSocket.close()
+        loop.close()
+        self.run = False
+        print("Server Thread Exiting. Dropped: %s, Overflowed: %s" % (CommandQueue.droppedCount, self.overflowCount))
+
+    def receiveInto(self, serverSocket, slot):
+        """
+        Reads one datagram into a ring slot. Returns its length, 0 if it was
+        empty or oversized, or None once nothing is pending.
+        """
+        try:
+            nbytes = serverSocket.recv_into(self.ringViews[slot])
+        except (BlockingIOError, InterruptedError):
+            return None
+        except OSError as e:
+            # Windows reports a datagram larger than the buffer as an error instead of truncating it.
+            if getattr(e, "winerror", None) != WSAEMSGSIZE:
+                print("Socket failed to receive: %s" % (e))
+                return None
+            nbytes = DatagramSize + 1
+        if nbytes > DatagramSize:
+            self.overflowCount += 1
+            return 0
+        return nbytes
+
+    def receiveDatagram(self, serverSocket):
+        nbytes = self.receiveInto(serverSocket, 0)
+        if nbytes:
+            # The dispatch key is the only per-datagram object; dict lookups need something hashable.
+            CommandQueue.push(self.ringViews[0][:nbytes].tobytes())
+
+    def drainSocket(self, serverSocket):
+        """
+        Batched receive: read every pending datagram into the ring, handing each
+        full ring (and the final partial one) to the command queue in one go.
+        """
+        count = 0
+        # Discarded datagrams count toward the bound too, or a flood of
+        # oversized ones would keep this loop spinning.
+        remaining = ReceiveBatchSize * ReceiveBatchesPerWakeup
+        while remaining:
+            nbytes = self.receiveInto(serverSocket, count)
+            if nbytes is None:
                 break
-        if not self.socketClosed:
-            self.socketClosed = True
-            self.serverSocket.shutdown(socket.SHUT_RDWR)
-            self.serverSocket.close()
-            self.serverSocket = None
-        print("Server Thread Exiting.")
-        
-        
-    def forceCloseServerSocket(self):
-        self.socketClosed = True
-        self.serverSocket.shutdown(socket.SHUT_RDWR)
-        self.serverSocket.close()
+            remaining -= 1
+            if nbytes == 0:
+                continue
+            self.ringLengths[count] = nbytes
+            count += 1
+            if count == ReceiveBatchSize:
+                self.dispatchBatch(count)
+                count = 0
+        if count:
+            self.dispatchBatch(count)
+
+    def dispatchBatch(self, count):
+        views = self.ringViews
+        lengths = self.ringLengths
+        CommandQueue.pushMany([views[i][:lengths[i]].tobytes() for i in range(count)])
+
+    def checkPing(self, loop):
+        elapsed = time.monotonic() - self.lastPingTime
+        if elapsed >= self.closeIfNoPingInXSeconds:
+            print("Closing server due to ping not received.")
+            loop.stop()
+        else:
+            loop.call_later(self.closeIfNoPingInXSeconds - elapsed, self.checkPing, loop)
+
+    def stopServer(self):
         self.run = False
-        print("serverSocket: %s" % (self.serverSocket))
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(loop.stop)
+            except RuntimeError:
+                # The loop already closed on its own.
+                pass
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+        self.loop = None
+
+    def restartServer(self):
+        self.stopServer()
+        self.createServerThread()
 
 
 class VariationType:
@@ -154,6 +354,51 @@ class MovementType:
 
 Movement = MovementType()
 
+class EasingType:
+    def __init__(self):
+        self.Type = "Easing"
+        # Display name per EASING_* value, in list order.
+        self.Names = [
+            (EASING_LINEAR, "Linear"),
+            (EASING_IN_QUAD, "Ease In Quad"),
+            (EASING_OUT_QUAD, "Ease Out Quad"),
+            (EASING_IN_OUT_QUAD, "Ease In Out Quad"),
+            (EASING_IN_CUBIC, "Ease In Cubic"),
+            (EASING_OUT_CUBIC, "Ease Out Cubic"),
+            (EASING_IN_OUT_CUBIC, "Ease In Out Cubic"),
+            (EASING_IN_EXPO, "Ease In Expo"),
+            (EASING_OUT_EXPO, "Ease Out Expo"),
+            (EASING_IN_OUT_EXPO, "Ease In Out Expo"),
+            (EASING_IN_BACK, "Ease In Back"),
+            (EASING_OUT_BACK, "Ease Out Back"),
+            (EASING_IN_OUT_BACK, "Ease In Out Back"),
+            (EASING_OUT_ELASTIC, "Ease Out Elastic"),
+            (EASING_OUT_BOUNCE, "Ease Out Bounce"),
+            (EASING_CUBIC_BEZIER, "Cubic Bezier"),
+        ]
+
+Easing = EasingType()
+
+class TargetType:
+    def __init__(self):
+        self.Type = "Target Scene"
+        self.Program = "Program"
+        self.Preview = "Preview (Studio Mode)"
+        self.Scene = "Named Scene"
+        self.All = "All Scenes"
+
+Target = TargetType()
+
+class EdgeType:
+    def __init__(self):
+        self.Type = "Canvas Edge"
+        self.None_ = "None"
+        self.Stop = "Stop"
+        self.Bounce = "Bounce"
+        self.Wrap = "Wrap"
+
+Edge = EdgeType()
+
 class DirectionType:
     def __init__(self):
         self.Type = "DirectionType"
@@ -175,6 +420,35 @@ class DirectionType:
         self.DOWN_LEFT_INDEX = 6
         self.DOWN_RIGHT_INDEX = 7
 
+        # Prefixes a PositionFreeAll command can carry in front of its command suffix.
+        self.Prefixes = {
+            "Up": self.UP_INDEX,
+            "Down": self.DOWN_INDEX,
+            "Left": self.LEFT_INDEX,
+            "Right": self.RIGHT_INDEX,
+            "UpLeft": self.UP_LEFT_INDEX,
+            "Up_Left": self.UP_LEFT_INDEX,
+            "UpRight": self.UP_RIGHT_INDEX,
+            "Up_Right": self.UP_RIGHT_INDEX,
+            "DownLeft": self.DOWN_LEFT_INDEX,
+            "Down_Left": self.DOWN_LEFT_INDEX,
+            "DownRight": self.DOWN_RIGHT_INDEX,
+            "Down_Right": self.DOWN_RIGHT_INDEX,
+        }
+
+        diagonal = math.sqrt(0.5)
+        # Unit heading per direction index for free movement.
+        self.Headings = {
+            self.UP_INDEX: (0.0, -1.0),
+            self.DOWN_INDEX: (0.0, 1.0),
+            self.LEFT_INDEX: (-1.0, 0.0),
+            self.RIGHT_INDEX: (1.0, 0.0),
+            self.UP_LEFT_INDEX: (-diagonal, -diagonal),
+            self.UP_RIGHT_INDEX: (diagonal, -diagonal),
+            self.DOWN_LEFT_INDEX: (-diagonal, diagonal),
+            self.DOWN_RIGHT_INDEX: (diagonal, diagonal),
+        }
+
 class Animation:
   def __init__(self, animationIndex):
     self.animationIndex = animationIndex
@@ -194,12 +468,41 @@ class Animation:
     self.movementType = Movement.Duration
     self.duration = 3
     self.posSpeed = 10
+    # Free movement ramps, in pixels per second squared. 0 reaches the speed at once.
+    self.acceleration = 0
+    self.deceleration = 0
+    # What happens when the item reaches the canvas edge, less edgeMargin pixels.
+    self.edgeBehavior = EDGE_NONE
+    self.edgeMargin = 0
+    # Follow the destination with a spring; a new destination mid-move keeps the velocity.
+    self.springFollow = False
+    self.springStiffness = 100.0
+    # 1 is critically damped: the quickest approach that doesn't overshoot.
+    self.springDamping = 1.0
+    self.easing = EASING_LINEAR
+    # Control points used by EASING_CUBIC_BEZIER, CSS "ease" by default.
+    self.bezierX1 = 0.25
+    self.bezierY1 = 0.1
+    self.bezierX2 = 0.25
+    self.bezierY2 = 1.0
 
     self.changeSizeInPlace = False
+    # Write fractional positions instead of whole pixels.
+    self.subPixel = False
+    # Move the source's item in every scene, not just the current one.
+    self.linked = False
 
     self.posDirection = Direction.RIGHT_INDEX
     self.command = ""
     self.stopCommand = ""
+    # Source this animation moves. Blank targets the script's Video Source.
+    self.sourceName = ""
+    # Scene whose item is moved; targetSceneName is used with TARGET_SCENE.
+    self.target = TARGET_PROGRAM
+    self.targetSceneName = ""
+    # Scene item to move in the target scene, by id. 0 finds the source's item by name.
+    # Ids are only unique per scene, so the settings only keep one for TARGET_SCENE.
+    self.sceneItemId = 0
 
     self.customStartingSettingStorage = "customStartingSetting" + str(animationIndex)
     self.startingXStorage = "startingX" + str(animationIndex)
@@ -213,19 +516,56 @@ class Animation:
     self.destinationHeightStorage = "destinationHeight" + str(animationIndex)
     self.variationTypeStorage = "variation_type" + str(animationIndex)
     self.movementTypeStorage = "movementTypeStorage" + str(animationIndex)
+    self.easingStorage = "easingStorage" + str(animationIndex)
+    self.bezierX1Storage = "bezierX1Storage" + str(animationIndex)
+    self.bezierY1Storage = "bezierY1Storage" + str(animationIndex)
+    self.bezierX2Storage = "bezierX2Storage" + str(animationIndex)
+    self.bezierY2Storage = "bezierY2Storage" + str(animationIndex)
     self.posSpeedStorage = "posSpeedStorage" + str(animationIndex)
     self.durationStorage = "durationStorage" + str(animationIndex)
+    self.accelerationStorage = "accelerationStorage" + str(animationIndex)
+    self.decelerationStorage = "decelerationStorage" + str(animationIndex)
+    self.edgeBehaviorStorage = "edgeBehaviorStorage" + str(animationIndex)
+    self.edgeMarginStorage = "edgeMarginStorage" + str(animationIndex)
+    self.springFollowStorage = "springFollowStorage" + str(animationIndex)
+    self.springStiffnessStorage = "springStiffnessStorage" + str(animationIndex)
+    self.springDampingStorage = "springDampingStorage" + str(animationIndex)
     self.posDirectionStorage = "posDirectionStorage" + str(animationIndex)
     self.setDestinationStorage = "setDestinationStorage" + str(animationIndex)
+    self.groupStorage = "animationGroup" + str(animationIndex)
     self.changeSizeInPlaceStorage = "changeSizeInPlaceStorage" + str(animationIndex)
+    self.subPixelStorage = "subPixelStorage" + str(animationIndex)
+    self.linkedStorage = "linkedStorage" + str(animationIndex)
     self.commandStorage = "command" + str(animationIndex)
     self.stopCommandStorage = "stopCommand" + str(animationIndex)
+    self.sourceNameStorage = "sourceName" + str(animationIndex)
+    self.targetStorage = "targetStorage" + str(animationIndex)
+    self.targetSceneNameStorage = "targetSceneNameStorage" + str(animationIndex)
+    self.sceneItemIdStorage = "sceneItemIdStorage" + str(animationIndex)
 
 class SourceClass:
-    def __init__(self):
+    def __init__(self, name, slot, target=TARGET_PROGRAM, targetSceneName="", itemId=0):
+        self.name = name
+        # Registry key: the same source in different target scenes, or different
+        # items of it, animate independently.
+        self.key = (name, target, targetSceneName, itemId)
+        self.target = target
+        self.targetSceneName = targetSceneName
+        # Scene item id this source was asked for, 0 when it is found by name.
+        self.itemId = itemId
+        self.sceneItem = None
+        self.sceneItemId = 0
+        # Scene sceneItem was found in.
+        self.sceneName = ""
+        # Also move this source's items in every other scene.
+        self.linked = False
+        # This source's index into the MotionState arrays.
+        self.slot = slot
+        # Set once a move has been compiled into the slot from the item's transform.
+        self.initialized = False
+        # Set when something other than this script moved the item, so the next tick re-reads it.
+        self.needsResync = False
         self.pos = obs.vec2()
-        # This is needed to store the remainder values since position is integer only.
-        self.posRemainder = obs.vec2()
         self.size = obs.vec2()
         self.scale = obs.vec2()
         self.targetPos = obs.vec2()
@@ -233,15 +573,27 @@ class SourceClass:
         self.targetScale = obs.vec2()
         self.posSpeed = 1
         self.processingAnimation = False
-        self.forceX = 0
-        self.forceY = 0
-        self.forceW = 0
-        self.forceH = 0
-
-    def GetXAndYForce(self, movementType, duration):
-        self.forceX = 0
-        self.forceY = 0
-
+        # Fraction of the position and scale change covered per second.
+        self.posRate = InstantRate
+        self.scaleRate = InstantRate
+        # Row of EasingTables applied to the current move.
+        self.easingRow = EASING_LINEAR
+        self.subPixel = False
+        # Free movement: integrated from a heading and acceleration instead of a trajectory.
+        self.kinematic = False
+        self.heading = (0.0, 0.0)
+        self.acceleration = 0
+        self.deceleration = 0
+        self.edgeBehavior = EDGE_NONE
+        self.edgeMargin = 0
+        # Unscaled size, so the tick can work out the item's size at any scale.
+        self.baseSize = (0, 0)
+        # Spring follow: pulled toward targetPos and targetScale.
+        self.spring = False
+        self.springStiffness = 0
+        self.springDamping = 0
+
+    def GetPositionRate(self, movementType, duration):
         distance = math.sqrt(math.pow(self.targetPos.x - self.pos.x, 2) + math.pow(self.targetPos.y - self.pos.y, 2))
         if duration == 0:
             durationBasedSpeed = distance
@@ -254,89 +606,1263 @@ class SourceClass:
                 self.posSpeed = durationBasedSpeed
 
         if distance != 0:
-            self.forceX = self.posSpeed/distance * (self.targetPos.x - self.pos.x)
-            self.forceY = self.posSpeed/distance * (self.targetPos.y - self.pos.y)
-
-    def GetXAndYScaleForce(self, duration):
-        self.forceW = 0
-        self.forceH = 0
+            self.posRate = self.posSpeed / distance
+        else:
+            self.posRate = InstantRate
 
+    def GetScaleRate(self, duration):
+        # A duration of 0 has always meant the whole change over one second.
         if duration == 0:
-            self.forceW = self.targetScale.x - self.scale.x
-            self.forceH = self.targetScale.y - self.scale.y
+            self.scaleRate = 1.0
         else:
-            self.forceW = (self.targetScale.x - self.scale.x) / duration
-            self.forceH = (self.targetScale.y - self.scale.y) / duration
+            self.scaleRate = 1.0 / duration
 
-        
-       
+BACK_OVERSHOOT = 1.70158
+
+def easeInOut(easeIn):
+    # Runs easeIn over the first half and its mirror over the second.
+    return lambda t: easeIn(2 * t) / 2 if t < 0.5 else 1 - easeIn(2 - 2 * t) / 2
+
+def easeOut(easeIn):
+    return lambda t: 1 - easeIn(1 - t)
+
+def easeInExpo(t):
+    return 0.0 if t == 0 else math.pow(2, 10 * t - 10)
+
+def easeInBack(t):
+    return (BACK_OVERSHOOT + 1) * t * t * t - BACK_OVERSHOOT * t * t
+
+def easeOutElastic(t):
+    if t == 0 or t == 1:
+        return t
+    return math.pow(2, -10 * t) * math.sin((10 * t - 0.75) * (2 * math.pi / 3)) + 1
+
+def easeOutBounce(t):
+    if t < 1 / 2.75:
+        return 7.5625 * t * t
+    if t < 2 / 2.75:
+        t -= 1.5 / 2.75
+        return 7.5625 * t * t + 0.75
+    if t < 2.5 / 2.75:
+        t -= 2.25 / 2.75
+        return 7.5625 * t * t + 0.9375
+    t -= 2.625 / 2.75
+    return 7.5625 * t * t + 0.984375
+
+def cubicBezier(x1, y1, x2, y2):
+    """
+    CSS-style cubic-bezier timing function through (0,0), (x1,y1), (x2,y2), (1,1).
+    """
+    def bezier(s, p1, p2):
+        return 3 * (1 - s) * (1 - s) * s * p1 + 3 * (1 - s) * s * s * p2 + s * s * s
+
+    def evaluate(t):
+        # x(s) is monotonic for x1, x2 in [0, 1], so bisect for the s where x(s) = t.
+        low = 0.0
+        high = 1.0
+        for _ in range(32):
+            s = (low + high) / 2
+            if bezier(s, x1, x2) < t:
+                low = s
+            else:
+                high = s
+        return bezier((low + high) / 2, y1, y2)
+    return evaluate
+
+# EASING_* value -> curve over [0, 1]. Cubic bezier curves are built per set of control points.
+EasingFunctions = {
+    EASING_LINEAR: lambda t: t,
+    EASING_IN_QUAD: lambda t: t * t,
+    EASING_OUT_QUAD: easeOut(lambda t: t * t),
+    EASING_IN_OUT_QUAD: easeInOut(lambda t: t * t),
+    EASING_IN_CUBIC: lambda t: t * t * t,
+    EASING_OUT_CUBIC: easeOut(lambda t: t * t * t),
+    EASING_IN_OUT_CUBIC: easeInOut(lambda t: t * t * t),
+    EASING_IN_EXPO: easeInExpo,
+    EASING_OUT_EXPO: easeOut(easeInExpo),
+    EASING_IN_OUT_EXPO: easeInOut(easeInExpo),
+    EASING_IN_BACK: easeInBack,
+    EASING_OUT_BACK: easeOut(easeInBack),
+    EASING_IN_OUT_BACK: easeInOut(easeInBack),
+    EASING_OUT_ELASTIC: easeOutElastic,
+    EASING_OUT_BOUNCE: easeOutBounce,
+}
+
+class EasingTablesClass:
+    """
+    Every easing curve sampled once into a fixed-size table, so evaluating one
+    per tick is an index and a lerp whatever the curve. Rows 0 to
+    EASING_CUBIC_BEZIER - 1 are the EASING_* curves; each distinct set of
+    cubic-bezier control points gets its own row after them.
+    """
+    def __init__(self):
+        self.rows = [self.sample(EasingFunctions[easing]) for easing in range(EASING_CUBIC_BEZIER)]
+        # (x1, y1, x2, y2) -> row
+        self.bezierRows = {}
+        self.table = self.build()
+
+    def sample(self, function):
+        samples = [function(float(i) / EasingTableSize) for i in range(EasingTableSize + 1)]
+        # Every curve starts and lands exactly on its endpoints.
+        samples[0] = 0.0
+        samples[-1] = 1.0
+        return samples
+
+    def build(self):
+        if np is not None:
+            return np.array(self.rows)
+        return self.rows
+
+    def rowFor(self, animation):
+        easing = animation.easing
+        if easing == EASING_CUBIC_BEZIER:
+            controlPoints = (animation.bezierX1, animation.bezierY1, animation.bezierX2, animation.bezierY2)
+            row = self.bezierRows.get(controlPoints)
+            if row is None:
+                row = len(self.rows)
+                self.rows.append(self.sample(cubicBezier(*controlPoints)))
+                self.bezierRows[controlPoints] = row
+                self.table = self.build()
+            return row
+        if easing in EasingFunctions:
+            return easing
+        print("Unknown easing %s, using linear" % (easing))
+        return EASING_LINEAR
+
+    def evaluate(self, rows, done):
+        # done is clamped to [0, 1]; the last interval also covers done == 1.
+        position = np.clip(done, 0.0, 1.0) * EasingTableSize
+        index = np.minimum(position.astype(np.intp), EasingTableSize - 1)
+        low = self.table[rows, index]
+        return low + (self.table[rows, index + 1] - low) * (position - index)
+
+    def evaluateOne(self, row, done):
+        position = min(max(done, 0.0), 1.0) * EasingTableSize
+        index = min(int(position), EasingTableSize - 1)
+        samples = self.rows[row]
+        low = samples[index]
+        return low + (samples[index + 1] - low) * (position - index)
+
+class MotionStateClass:
+    """
+    Struct-of-arrays motion state for every source. When an animation starts,
+    compile() turns the values SourceClass worked out into a closed-form
+    trajectory in the source's slot: start, delta and rate. advance() then
+    evaluates every active slot at its elapsed time in one pass, vectorized
+    with NumPy when it is installed.
+    """
+    # (value, velocity, goal, rest distance, rest speed) for each spring-driven axis.
+    SpringAxes = [
+        ("exactX", "velX", "goalX", SpringRestDistance, SpringRestSpeed),
+        ("exactY", "velY", "goalY", SpringRestDistance, SpringRestSpeed),
+        ("scaleX", "scaleVelX", "goalScaleX", SpringRestScale, SpringRestScaleSpeed),
+        ("scaleY", "scaleVelY", "goalScaleY", SpringRestScale, SpringRestScaleSpeed),
+    ]
+
+    Fields = [
+        # Current transform.
+        "posX", "posY", "scaleX", "scaleY",
+        # Trajectory: value = start + delta * ease(min(elapsed * rate, 1)).
+        "startX", "startY", "deltaX", "deltaY",
+        "startScaleX", "startScaleY", "deltaScaleX", "deltaScaleY",
+        "posRate", "scaleRate", "elapsed", "easingRow",
+        # 1 where positions are written as floats, 0 where they snap to whole pixels.
+        "subPixel",
+        # Kinematic slots: exact position, velocity and the velocity they steer toward.
+        "kinematic", "exactX", "exactY", "velX", "velY",
+        "headingX", "headingY", "maxSpeed", "acceleration", "deceleration",
+        # Canvas edge handling for every mode: EDGE_* value, margin and unscaled size.
+        "edge", "margin", "baseWidth", "baseHeight",
+        # Spring slots share exactX/Y and velX/Y, and pull them and the scale toward a goal.
+        "spring", "goalX", "goalY", "goalScaleX", "goalScaleY",
+        "scaleVelX", "scaleVelY", "springStiffness", "springDamping",
+        # Last transform written to OBS, so unchanged components aren't written again.
+        "writtenX", "writtenY", "writtenScaleX", "writtenScaleY",
+    ]
+
+    def __init__(self):
+        self.capacity = 0
+        self.count = 0
+        for field in self.Fields:
+            setattr(self, field, self.allocate(0))
+
+    def allocate(self, capacity):
+        if np is not None:
+            return np.zeros(capacity)
+        return [0.0] * capacity
+
+    def addSlot(self):
+        if self.count == self.capacity:
+            self.grow(max(8, self.capacity * 2))
+        slot = self.count
+        self.count += 1
+        return slot
+
+    def grow(self, capacity):
+        for field in self.Fields:
+            old = getattr(self, field)
+            new = self.allocate(capacity)
+            new[:len(old)] = old
+            setattr(self, field, new)
+        self.capacity = capacity
+
+    def reset(self):
+        for field in self.Fields:
+            setattr(self, field, self.allocate(self.capacity))
+        self.count = 0
+
+    def compile(self, source, moving=False):
+        """
+        Loads the move SourceClass worked out into the source's slot. moving is
+        set when the source was already animating, so a free move keeps its
+        velocity and turns or speeds up from there.
+        """
+        slot = source.slot
+        self.edge[slot] = source.edgeBehavior
+        self.margin[slot] = source.edgeMargin
+        self.baseWidth[slot], self.baseHeight[slot] = source.baseSize
+        # Velocity only carries over between the modes that have one.
+        hasVelocity = moving and (self.kinematic[slot] != 0.0 or self.spring[slot] != 0.0)
+        if source.kinematic:
+            self.compileKinematic(source, hasVelocity)
+        else:
+            self.kinematic[slot] = 0.0
+        if source.spring:
+            self.compileSpring(source, hasVelocity)
+            return
+        self.spring[slot] = 0.0
+        self.posX[slot] = self.startX[slot] = source.pos.x
+        self.posY[slot] = self.startY[slot] = source.pos.y
+        self.scaleX[slot] = self.startScaleX[slot] = source.scale.x
+        self.scaleY[slot] = self.startScaleY[slot] = source.scale.y
+        self.deltaX[slot] = source.targetPos.x - source.pos.x
+        self.deltaY[slot] = source.targetPos.y - source.pos.y
+        self.deltaScaleX[slot] = source.targetScale.x - source.scale.x
+        self.deltaScaleY[slot] = source.targetScale.y - source.scale.y
+        self.posRate[slot] = source.posRate
+        self.scaleRate[slot] = source.scaleRate
+        self.easingRow[slot] = source.easingRow
+        self.subPixel[slot] = 1.0 if source.subPixel else 0.0
+        self.elapsed[slot] = 0.0
+        self.markWritten(slot)
+
+    def compileKinematic(self, source, keepVelocity):
+        slot = source.slot
+        if not keepVelocity:
+            self.exactX[slot] = source.pos.x
+            self.exactY[slot] = source.pos.y
+            self.velX[slot] = 0.0
+            self.velY[slot] = 0.0
+        self.kinematic[slot] = 1.0
+        self.headingX[slot], self.headingY[slot] = source.heading
+        self.maxSpeed[slot] = source.posSpeed
+        self.acceleration[slot] = source.acceleration
+        self.deceleration[slot] = source.deceleration
+
+    def compileSpring(self, source, keepVelocity):
+        slot = source.slot
+        if not keepVelocity:
+            self.exactX[slot] = source.pos.x
+            self.exactY[slot] = source.pos.y
+            self.velX[slot] = 0.0
+            self.velY[slot] = 0.0
+            self.scaleX[slot] = source.scale.x
+            self.scaleY[slot] = source.scale.y
+            self.scaleVelX[slot] = 0.0
+            self.scaleVelY[slot] = 0.0
+            self.posX[slot] = source.pos.x
+            self.posY[slot] = source.pos.y
+            self.markWritten(slot)
+        # Retargeting only moves the goal.
+        self.spring[slot] = 1.0
+        self.goalX[slot] = source.targetPos.x
+        self.goalY[slot] = source.targetPos.y
+        self.goalScaleX[slot] = source.targetScale.x
+        self.goalScaleY[slot] = source.targetScale.y
+        self.springStiffness[slot] = max(source.springStiffness, 1.0)
+        self.springDamping[slot] = 2.0 * source.springDamping * math.sqrt(self.springStiffness[slot])
+        self.subPixel[slot] = 1.0 if source.subPixel else 0.0
+
+    def brake(self, slot):
+        # Steer toward standing still; the slot finishes once it has.
+        self.headingX[slot] = 0.0
+        self.headingY[slot] = 0.0
+
+    def rebase(self, slot):
+        """
+        Bends a slot's trajectory through its current transform after someone
+        else moved the item. The targets, elapsed time and rates are kept, so
+        the move stays at the same point of its easing curve.
+        """
+        row = int(self.easingRow[slot])
+        posEased = EasingTables.evaluateOne(row, min(self.elapsed[slot] * self.posRate[slot], 1.0))
+        scaleEased = EasingTables.evaluateOne(row, min(self.elapsed[slot] * self.scaleRate[slot], 1.0))
+        self.startX[slot], self.deltaX[slot] = self.rebaseAxis(self.posX[slot], self.startX[slot] + self.deltaX[slot], posEased)
+        self.startY[slot], self.deltaY[slot] = self.rebaseAxis(self.posY[slot], self.startY[slot] + self.deltaY[slot], posEased)
+        self.startScaleX[slot], self.deltaScaleX[slot] = self.rebaseAxis(self.scaleX[slot], self.startScaleX[slot] + self.deltaScaleX[slot], scaleEased)
+        self.startScaleY[slot], self.deltaScaleY[slot] = self.rebaseAxis(self.scaleY[slot], self.startScaleY[slot] + self.deltaScaleY[slot], scaleEased)
+        self.exactX[slot] = self.posX[slot]
+        self.exactY[slot] = self.posY[slot]
+        self.markWritten(slot)
+
+    def rebaseAxis(self, value, end, eased):
+        """
+        Returns the start and delta of a curve that passes through value at
+        eased and still ends on end.
+        """
+        remaining = 1.0 - eased
+        if abs(remaining) < 1e-6:
+            # Nothing left of the curve to bend, so the item stays where it was put.
+            return value, 0.0
+        delta = (end - value) / remaining
+        return end - delta, delta
+
+    def markWritten(self, slot):
+        self.writtenX[slot] = self.posX[slot]
+        self.writtenY[slot] = self.posY[slot]
+        self.writtenScaleX[slot] = self.scaleX[slot]
+        self.writtenScaleY[slot] = self.scaleY[slot]
+
+    def advance(self, slots, dt):
+        """
+        Moves the given slots dt seconds along their trajectories. Returns three
+        per-slot sequences: whether it reached its target, whether its position
+        changed and whether its scale changed since the last write. The changes
+        are then treated as written.
+        """
+        if np is not None:
+            return self.advanceVectorized(np.asarray(slots), dt)
+        return self.advanceScalar(slots, dt)
+
+    def advanceVectorized(self, slots, dt):
+        elapsed = self.elapsed[slots] + dt
+        self.elapsed[slots] = elapsed
+        posDone = np.minimum(elapsed * self.posRate[slots], 1.0)
+        scaleDone = np.minimum(elapsed * self.scaleRate[slots], 1.0)
+        rows = self.easingRow[slots].astype(np.intp)
+        posEased = EasingTables.evaluate(rows, posDone)
+        scaleEased = EasingTables.evaluate(rows, scaleDone)
+
+        subPixel = self.subPixel[slots] != 0.0
+        posX = self.evaluatePosition(self.startX[slots], self.deltaX[slots], posDone, posEased, subPixel)
+        posY = self.evaluatePosition(self.startY[slots], self.deltaY[slots], posDone, posEased, subPixel)
+        scaleX = self.startScaleX[slots] + self.deltaScaleX[slots] * scaleEased
+        scaleY = self.startScaleY[slots] + self.deltaScaleY[slots] * scaleEased
+        finished = (posDone >= 1.0) & (scaleDone >= 1.0)
+
+        edge = self.edge[slots]
+        if Canvas.ready() and (edge != EDGE_NONE).any():
+            # A trajectory has fixed ends, so every edge behaviour just keeps it inside.
+            trajectoryEdge = np.where(edge != EDGE_NONE, EDGE_STOP, EDGE_NONE)
+            boundsX, boundsY = self.edgeBounds(slots, scaleX, scaleY)
+            still = np.zeros(len(slots))
+            posX = self.constrainAxis(trajectoryEdge, posX, still, boundsX)[0]
+            posY = self.constrainAxis(trajectoryEdge, posY, still, boundsY)[0]
+            posX = np.where(subPixel, posX, np.floor(posX))
+            posY = np.where(subPixel, posY, np.floor(posY))
+
+        kinematic = self.kinematic[slots] != 0.0
+        if kinematic.any():
+            exactX, exactY, stopped = self.integrateVectorized(slots[kinematic], dt)
+            posX[kinematic] = np.where(subPixel[kinematic], exactX, np.floor(exactX))
+            posY[kinematic] = np.where(subPixel[kinematic], exactY, np.floor(exactY))
+            finished[kinematic] = stopped
+
+        spring = self.spring[slots] != 0.0
+        if spring.any():
+            exactX, exactY, scaleX[spring], scaleY[spring], finished[spring] = self.springVectorized(slots[spring], dt)
+            posX[spring] = np.where(subPixel[spring], exactX, np.floor(exactX))
+            posY[spring] = np.where(subPixel[spring], exactY, np.floor(exactY))
+
+        posDirty = (posX != self.writtenX[slots]) | (posY != self.writtenY[slots])
+        scaleDirty = (scaleX != self.writtenScaleX[slots]) | (scaleY != self.writtenScaleY[slots])
+        self.posX[slots] = self.writtenX[slots] = posX
+        self.posY[slots] = self.writtenY[slots] = posY
+        self.scaleX[slots] = self.writtenScaleX[slots] = scaleX
+        self.scaleY[slots] = self.writtenScaleY[slots] = scaleY
+        return finished, posDirty, scaleDirty
+
+    def springVectorized(self, slots, dt):
+        """
+        Steps spring slots dt seconds with implicit Euler, which stays stable
+        however long the tick was. Returns the new exact positions, scales and
+        which slots have settled on their goal.
+        """
+        stiffness = self.springStiffness[slots]
+        damping = self.springDamping[slots]
+        denominator = 1.0 + dt * damping + dt * dt * stiffness
+        edge = self.edge[slots]
+        constrained = Canvas.ready() and (edge != EDGE_NONE).any()
+        if constrained:
+            bounds = self.edgeBounds(slots, self.scaleX[slots], self.scaleY[slots])
+        values = []
+        settled = np.ones(len(slots), dtype=bool)
+        for axis, (valueField, velocityField, goalField, restDistance, restSpeed) in enumerate(self.SpringAxes):
+            value = getattr(self, valueField)[slots]
+            goal = getattr(self, goalField)[slots]
+            # Only the position axes meet the canvas edge.
+            edged = constrained and axis < 2
+            if edged:
+                # A goal past the edge pulls toward the nearest point inside instead.
+                goal = np.where(edge != EDGE_NONE, np.clip(goal, bounds[axis][0], bounds[axis][1]), goal)
+            velocity = (getattr(self, velocityField)[slots] - dt * stiffness * (value - goal)) / denominator
+            value = value + dt * velocity
+            if edged:
+                value, velocity, bounced, below = self.constrainAxis(edge, value, velocity, bounds[axis])
+            settled &= (np.abs(goal - value) < restDistance) & (np.abs(velocity) < restSpeed)
+            values.append((valueField, velocityField, goal, value, velocity))
+        results = []
+        for valueField, velocityField, goal, value, velocity in values:
+            # Snap the last fraction so the item lands exactly on its goal.
+            value = np.where(settled, goal, value)
+            velocity = np.where(settled, 0.0, velocity)
+            getattr(self, valueField)[slots] = value
+            getattr(self, velocityField)[slots] = velocity
+            results.append(value)
+        return results[0], results[1], results[2], results[3], settled
+
+    def integrateVectorized(self, slots, dt):
+        """
+        Steps kinematic slots dt seconds: velocity moves toward heading * maxSpeed
+        at the acceleration (or the deceleration when braking), then the exact
+        position moves by the velocity. Returns the new exact positions and
+        which slots have come to rest after a brake.
+        """
+        velX = self.velX[slots]
+        velY = self.velY[slots]
+        headingX = self.headingX[slots]
+        headingY = self.headingY[slots]
+        steering = (headingX != 0.0) | (headingY != 0.0)
+        goalX = headingX * self.maxSpeed[slots]
+        goalY = headingY * self.maxSpeed[slots]
+        rate = np.where(steering, self.acceleration[slots], self.deceleration[slots])
+        diffX = goalX - velX
+        diffY = goalY - velY
+        distance = np.hypot(diffX, diffY)
+        step = rate * dt
+        # A rate of 0 reaches the goal velocity at once.
+        reached = (rate <= 0.0) | (distance <= step)
+        fraction = step / np.maximum(distance, 1e-9)
+        velX = np.where(reached, goalX, velX + diffX * fraction)
+        velY = np.where(reached, goalY, velY + diffY * fraction)
+
+        exactX = self.exactX[slots] + velX * dt
+        exactY = self.exactY[slots] + velY * dt
+        edge = self.edge[slots]
+        if Canvas.ready() and (edge != EDGE_NONE).any():
+            boundsX, boundsY = self.edgeBounds(slots, self.scaleX[slots], self.scaleY[slots])
+            exactX, velX, bouncedX, belowX = self.constrainAxis(edge, exactX, velX, boundsX)
+            exactY, velY, bouncedY, belowY = self.constrainAxis(edge, exactY, velY, boundsY)
+            # A bounce turns the heading around too, so the item keeps going the other way.
+            self.headingX[slots] = np.where(bouncedX, np.where(belowX, np.abs(headingX), -np.abs(headingX)), headingX)
+            self.headingY[slots] = np.where(bouncedY, np.where(belowY, np.abs(headingY), -np.abs(headingY)), headingY)
+
+        self.velX[slots] = velX
+        self.velY[slots] = velY
+        self.exactX[slots] = exactX
+        self.exactY[slots] = exactY
+        return exactX, exactY, ~steering & (velX == 0.0) & (velY == 0.0)
+
+    def edgeBounds(self, slots, scaleX, scaleY):
+        """
+        Per-axis (low, high, wrapLow, wrapLength) for the slots at the given
+        scales. low and high keep the item inside the canvas less the margin, or
+        covering it when the item is bigger (a zoomed-in camera). A wrapping
+        item reappears once it is fully past an edge.
+        """
+        margin = self.margin[slots]
+        bounds = []
+        for canvasLength, base, scale in [(Canvas.width, self.baseWidth[slots], scaleX), (Canvas.height, self.baseHeight[slots], scaleY)]:
+            size = base * np.abs(scale)
+            span = canvasLength - 2 * margin
+            bounds.append((margin + np.minimum(0.0, span - size), margin + np.maximum(0.0, span - size), margin - size, span + size))
+        return bounds
+
+    def constrainAxis(self, edge, value, velocity, bounds):
+        """
+        Applies each slot's edge behaviour along one axis. Returns the new values
+        and velocities, which slots bounced and whether that was off the low edge.
+        """
+        low, high, wrapLow, wrapLength = bounds
+        below = value < low
+        outside = below | (value > high)
+        stop = (edge == EDGE_STOP) & outside
+        bounced = (edge == EDGE_BOUNCE) & outside
+        wrap = (edge == EDGE_WRAP) & ((value < wrapLow) | (value > wrapLow + wrapLength))
+        reflected = np.where(below, 2 * low - value, 2 * high - value)
+        value = np.where(stop, np.clip(value, low, high), value)
+        value = np.where(bounced, np.clip(reflected, low, high), value)
+        value = np.where(wrap, wrapLow + np.mod(value - wrapLow, np.maximum(wrapLength, 1.0)), value)
+        velocity = np.where(stop, 0.0, velocity)
+        velocity = np.where(bounced, np.where(below, np.abs(velocity), -np.abs(velocity)), velocity)
+        return value, velocity, bounced, below
+
+    def evaluatePosition(self, start, delta, done, eased, subPixel):
+        # Positions move in whole pixels unless sub-pixel, and land exactly on the target.
+        step = delta * eased
+        step = np.where(subPixel, step, np.floor(step))
+        return np.where(done >= 1.0, start + delta, start + step)
+
+    def advanceScalar(self, slots, dt):
+        finished = []
+        posDirty = []
+        scaleDirty = []
+        for slot in slots:
+            elapsed = self.elapsed[slot] + dt
+            self.elapsed[slot] = elapsed
+            posDone = min(elapsed * self.posRate[slot], 1.0)
+            scaleDone = min(elapsed * self.scaleRate[slot], 1.0)
+            row = int(self.easingRow[slot])
+            posEased = EasingTables.evaluateOne(row, posDone)
+            scaleEased = EasingTables.evaluateOne(row, scaleDone)
+
+            if self.spring[slot]:
+                posDone = scaleDone = 1.0 if self.springScalar(slot, dt) else 0.0
+                self.placeExact(slot)
+            elif self.kinematic[slot]:
+                posDone = 1.0 if self.integrateScalar(slot, dt) else 0.0
+                self.placeExact(slot)
+            elif posDone >= 1.0:
+                self.posX[slot] = self.startX[slot] + self.deltaX[slot]
+                self.posY[slot] = self.startY[slot] + self.deltaY[slot]
+            elif self.subPixel[slot]:
+                self.posX[slot] = self.startX[slot] + self.deltaX[slot] * posEased
+                self.posY[slot] = self.startY[slot] + self.deltaY[slot] * posEased
+            else:
+                self.posX[slot] = self.startX[slot] + math.floor(self.deltaX[slot] * posEased)
+                self.posY[slot] = self.startY[slot] + math.floor(self.deltaY[slot] * posEased)
+            if not self.spring[slot]:
+                self.scaleX[slot] = self.startScaleX[slot] + self.deltaScaleX[slot] * scaleEased
+                self.scaleY[slot] = self.startScaleY[slot] + self.deltaScaleY[slot] * scaleEased
+            if not self.spring[slot] and not self.kinematic[slot] and self.edge[slot] != EDGE_NONE and Canvas.ready():
+                # A trajectory has fixed ends, so every edge behaviour just keeps it inside.
+                boundsX, boundsY = self.edgeBoundsOne(slot, self.scaleX[slot], self.scaleY[slot])
+                self.posX[slot] = self.constrainAxisOne(EDGE_STOP, self.posX[slot], 0.0, boundsX)[0]
+                self.posY[slot] = self.constrainAxisOne(EDGE_STOP, self.posY[slot], 0.0, boundsY)[0]
+                if not self.subPixel[slot]:
+                    self.posX[slot] = math.floor(self.posX[slot])
+                    self.posY[slot] = math.floor(self.posY[slot])
+
+            finished.append(posDone >= 1.0 and scaleDone >= 1.0)
+            posDirty.append(self.posX[slot] != self.writtenX[slot] or self.posY[slot] != self.writtenY[slot])
+            scaleDirty.append(self.scaleX[slot] != self.writtenScaleX[slot] or self.scaleY[slot] != self.writtenScaleY[slot])
+            self.markWritten(slot)
+        return finished, posDirty, scaleDirty
+
+    def placeExact(self, slot):
+        if self.subPixel[slot]:
+            self.posX[slot] = self.exactX[slot]
+            self.posY[slot] = self.exactY[slot]
+        else:
+            self.posX[slot] = math.floor(self.exactX[slot])
+            self.posY[slot] = math.floor(self.exactY[slot])
+
+    def springScalar(self, slot, dt):
+        # Same step as springVectorized for one slot. Returns whether it settled.
+        stiffness = self.springStiffness[slot]
+        denominator = 1.0 + dt * self.springDamping[slot] + dt * dt * stiffness
+        edge = self.edge[slot]
+        constrained = edge != EDGE_NONE and Canvas.ready()
+        if constrained:
+            bounds = self.edgeBoundsOne(slot, self.scaleX[slot], self.scaleY[slot])
+        settled = True
+        goals = []
+        for axis, (valueField, velocityField, goalField, restDistance, restSpeed) in enumerate(self.SpringAxes):
+            values = getattr(self, valueField)
+            velocities = getattr(self, velocityField)
+            goal = getattr(self, goalField)[slot]
+            edged = constrained and axis < 2
+            if edged:
+                goal = min(max(goal, bounds[axis][0]), bounds[axis][1])
+            velocities[slot] = (velocities[slot] - dt * stiffness * (values[slot] - goal)) / denominator
+            values[slot] = values[slot] + dt * velocities[slot]
+            if edged:
+                values[slot], velocities[slot], bounced, below = self.constrainAxisOne(edge, values[slot], velocities[slot], bounds[axis])
+            settled = settled and abs(goal - values[slot]) < restDistance and abs(velocities[slot]) < restSpeed
+            goals.append(goal)
+        if settled:
+            for axis, (valueField, velocityField, goalField, restDistance, restSpeed) in enumerate(self.SpringAxes):
+                getattr(self, valueField)[slot] = goals[axis]
+                getattr(self, velocityField)[slot] = 0.0
+        return settled
+
+    def integrateScalar(self, slot, dt):
+        # Same step as integrateVectorized for one slot. Returns whether it came to rest.
+        steering = self.headingX[slot] != 0.0 or self.headingY[slot] != 0.0
+        goalX = self.headingX[slot] * self.maxSpeed[slot]
+        goalY = self.headingY[slot] * self.maxSpeed[slot]
+        rate = self.acceleration[slot] if steering else self.deceleration[slot]
+        diffX = goalX - self.velX[slot]
+        diffY = goalY - self.velY[slot]
+        distance = math.hypot(diffX, diffY)
+        step = rate * dt
+        if rate <= 0.0 or distance <= step:
+            velX = goalX
+            velY = goalY
+        else:
+            fraction = step / max(distance, 1e-9)
+            velX = self.velX[slot] + diffX * fraction
+            velY = self.velY[slot] + diffY * fraction
+
+        exactX = self.exactX[slot] + velX * dt
+        exactY = self.exactY[slot] + velY * dt
+        edge = self.edge[slot]
+        if edge != EDGE_NONE and Canvas.ready():
+            boundsX, boundsY = self.edgeBoundsOne(slot, self.scaleX[slot], self.scaleY[slot])
+            exactX, velX, bouncedX, belowX = self.constrainAxisOne(edge, exactX, velX, boundsX)
+            exactY, velY, bouncedY, belowY = self.constrainAxisOne(edge, exactY, velY, boundsY)
+            if bouncedX:
+                self.headingX[slot] = abs(self.headingX[slot]) if belowX else -abs(self.headingX[slot])
+            if bouncedY:
+                self.headingY[slot] = abs(self.headingY[slot]) if belowY else -abs(self.headingY[slot])
+
+        self.velX[slot] = velX
+        self.velY[slot] = velY
+        self.exactX[slot] = exactX
+        self.exactY[slot] = exactY
+        return not steering and velX == 0.0 and velY == 0.0
+
+    def edgeBoundsOne(self, slot, scaleX, scaleY):
+        # Same bounds as edgeBounds for one slot.
+        margin = self.margin[slot]
+        bounds = []
+        for canvasLength, base, scale in [(Canvas.width, self.baseWidth[slot], scaleX), (Canvas.height, self.baseHeight[slot], scaleY)]:
+            size = base * abs(scale)
+            span = canvasLength - 2 * margin
+            bounds.append((margin + min(0.0, span - size), margin + max(0.0, span - size), margin - size, span + size))
+        return bounds
+
+    def constrainAxisOne(self, edge, value, velocity, bounds):
+        # Same edge behaviour as constrainAxis for one slot.
+        low, high, wrapLow, wrapLength = bounds
+        below = value < low
+        outside = below or value > high
+        if edge == EDGE_STOP and outside:
+            return min(max(value, low), high), 0.0, False, below
+        if edge == EDGE_BOUNCE and outside:
+            reflected = 2 * low - value if below else 2 * high - value
+            return min(max(reflected, low), high), abs(velocity) if below else -abs(velocity), True, below
+        if edge == EDGE_WRAP and (value < wrapLow or value > wrapLow + wrapLength):
+            return wrapLow + (value - wrapLow) % max(wrapLength, 1.0), velocity, False, below
+        return value, velocity, False, below
+
+class SourceRegistryClass:
+    """
+    Animation state for every targeted source, keyed by source name and
+    target scene. Each animation drives its own source and one tick advances
+    all active ones.
+    """
+    def __init__(self):
+        self.sources = {}
+        # Sources with an animation in progress, in the order they started.
+        self.active = {}
+        # Scene name -> signal handler we listen to for item_transform.
+        self.transformHandlers = {}
+
+    def get(self, name, target=TARGET_PROGRAM, targetSceneName="", itemId=0):
+        if target != TARGET_SCENE:
+            targetSceneName = ""
+        source = self.sources.get((name, target, targetSceneName, itemId))
+        if source is None:
+            source = SourceClass(name, Motion.addSlot(), target, targetSceneName, itemId)
+            self.sources[source.key] = source
+        return source
+
+    def forAnimation(self, animation):
+        return self.get(animation.sourceName or source_name, animation.target, animation.targetSceneName, animation.sceneItemId)
+
+    def start(self, source):
+        source.processingAnimation = True
+        self.active[source.key] = source
+
+    def stop(self, source):
+        source.processingAnimation = False
+        self.active.pop(source.key, None)
+
+    def stopAll(self):
+        for source in list(self.active.values()):
+            source.processingAnimation = False
+        self.active.clear()
+
+    def attach(self, source, sceneItem):
+        source.sceneItem = sceneItem
+        source.sceneName = SceneItems.sceneFor(source)
+        if sceneItem is not None:
+            source.sceneItemId = obs.obs_sceneitem_get_id(sceneItem)
+            if source.itemId:
+                # An item picked by id may belong to a different source than the configured one.
+                source.name = obs.obs_source_get_name(obs.obs_sceneitem_get_source(sceneItem))
+            self.watchTransforms(sceneItem)
+
+    def watchTransforms(self, sceneItem):
+        sceneSource = obs.obs_scene_get_source(obs.obs_sceneitem_get_scene(sceneItem))
+        sceneName = obs.obs_source_get_name(sceneSource)
+        if sceneName not in self.transformHandlers:
+            handler = obs.obs_source_get_signal_handler(sceneSource)
+            obs.signal_handler_connect(handler, "item_transform", itemTransformed)
+            self.transformHandlers[sceneName] = handler
+
+    def unwatchTransforms(self):
+        for handler in self.transformHandlers.values():
+            obs.signal_handler_disconnect(handler, "item_transform", itemTransformed)
+        self.transformHandlers.clear()
+
+    def refreshSceneItems(self, targets=None):
+        # A source missing from the old scene may be in the new one, so every affected source is looked up again.
+        # Frontend events run on the UI thread while a tick may add sources, so walk a snapshot.
+        for source in list(self.sources.values()):
+            if targets is None or source.target in targets:
+                self.attach(source, findSceneItem(source))
+                # A source that never started has nothing in its slot to carry over.
+                source.needsResync = source.initialized
+
+    def itemRemoved(self, name, sceneName, sceneItemId):
+        # The item is about to be freed, so stop holding it. The next command looks the source up again.
+        for source in list(self.sources.values()):
+            if source.name == name and source.sceneName == sceneName and source.sceneItemId == sceneItemId:
+                source.sceneItem = None
+
+    def clear(self):
+        self.stopAll()
+        self.unwatchTransforms()
+        self.sources.clear()
+        BaseSizes.clear()
+        Motion.reset()
+
+
+class BaseSizeCacheClass:
+    """
+    Base width and height per source name, read from OBS once and dropped when
+    the source signals a change that can resize it (e.g. a capture card
+    switching modes).
+    """
+    # Source signals after which the base size may differ.
+    Signals = ["update", "activate"]
+
+    def __init__(self):
+        self.sizes = {}
+        # Source name -> signal handler we listen to.
+        self.handlers = {}
+
+    def get(self, source):
+        size = self.sizes.get(source.name)
+        if size is None:
+            src = obs.obs_sceneitem_get_source(source.sceneItem)
+            size = (obs.obs_source_get_base_width(src), obs.obs_source_get_base_height(src))
+            # Sources report 0x0 until they produce a frame, which isn't worth keeping.
+            if size[0] and size[1]:
+                self.sizes[source.name] = size
+                self.watch(source.name, src)
+        return size
+
+    def watch(self, name, src):
+        if name not in self.handlers:
+            handler = obs.obs_source_get_signal_handler(src)
+            for signal in self.Signals:
+                obs.signal_handler_connect(handler, signal, baseSizeChanged)
+            self.handlers[name] = handler
+
+    def invalidate(self, name):
+        self.sizes.pop(name, None)
+
+    def clear(self):
+        for handler in self.handlers.values():
+            for signal in self.Signals:
+                obs.signal_handler_disconnect(handler, signal, baseSizeChanged)
+        self.handlers.clear()
+        self.sizes.clear()
+
+class SceneItemIndexClass:
+    """
+    Scene items in every scene, keyed by source name and then scene name,
+    including items nested in groups (indexed under the scene holding the
+    group). Built once on first use and kept current from item_add and
+    item_remove signals and frontend scene events, so a lookup is two dict
+    reads instead of a search through the scene.
+    """
+    def __init__(self):
+        # Source name -> scene name -> scene item
+        self.items = {}
+        # Scene name -> scene item id -> (source name, scene item)
+        self.ids = {}
+        # Scene name -> scene, for the recursive fallback lookup.
+        self.scenes = {}
+        # Group name -> names of the scenes holding it.
+        self.groupOwners = {}
+        # (source name, scene name) pairs whose indexed item sits inside a group.
+        self.nested = set()
+        # Scene or group name -> signal handler we listen to for item_add/item_remove.
+        self.handlers = {}
+        # Program and preview scene names, kept current from frontend events.
+        self.currentScene = ""
+        self.previewScene = ""
+        self.built = False
+
+    def build(self):
+        self.clear()
+        sceneSources = obs.obs_frontend_get_scenes()
+        if sceneSources is not None:
+            for sceneSource in sceneSources:
+                sceneName = obs.obs_source_get_name(sceneSource)
+                scene = obs.obs_scene_from_source(sceneSource)
+                self.scenes[sceneName] = scene
+                self.watch(sceneName, sceneSource)
+                self.addItems(sceneName, scene)
+            obs.source_list_release(sceneSources)
+        self.currentScene = findCurrentSceneName()
+        self.previewScene = findPreviewSceneName()
+        self.built = True
+
+    def addItems(self, sceneName, scene, nested=False):
+        sceneItems = obs.obs_scene_enum_items(scene)
+        if sceneItems is not None:
+            for sceneItem in sceneItems:
+                self.addItem(sceneName, sceneItem, nested)
+            obs.sceneitem_list_release(sceneItems)
+
+    def addItem(self, sceneName, sceneItem, nested=False):
+        source = obs.obs_sceneitem_get_source(sceneItem)
+        name = obs.obs_source_get_name(source)
+        # Like obs_scene_find_source, the first item for a source in a scene wins.
+        if self.items.setdefault(name, {}).setdefault(sceneName, sceneItem) is sceneItem and nested:
+            self.nested.add((name, sceneName))
+        self.ids.setdefault(sceneName, {})[obs.obs_sceneitem_get_id(sceneItem)] = (name, sceneItem)
+        if obs.obs_sceneitem_is_group(sceneItem):
+            owners = self.groupOwners.setdefault(name, [])
+            if sceneName not in owners:
+                owners.append(sceneName)
+            self.watch(name, source)
+            self.addItems(sceneName, obs.obs_sceneitem_group_get_scene(sceneItem), True)
+
+    def removeItem(self, sceneName, sceneItem):
+        name = obs.obs_source_get_name(obs.obs_sceneitem_get_source(sceneItem))
+        sceneItemId = obs.obs_sceneitem_get_id(sceneItem)
+        scenes = self.items.get(name)
+        if scenes is not None:
+            indexed = scenes.get(sceneName)
+            if indexed is not None and obs.obs_sceneitem_get_id(indexed) == sceneItemId:
+                del scenes[sceneName]
+                self.nested.discard((name, sceneName))
+        self.ids.get(sceneName, {}).pop(sceneItemId, None)
+        if obs.obs_sceneitem_is_group(sceneItem):
+            owners = self.groupOwners.get(name)
+            if owners is not None and sceneName in owners:
+                owners.remove(sceneName)
+            sceneItems = obs.obs_scene_enum_items(obs.obs_sceneitem_group_get_scene(sceneItem))
+            if sceneItems is not None:
+                for child in sceneItems:
+                    self.removeItem(sceneName, child)
+                obs.sceneitem_list_release(sceneItems)
+        Sources.itemRemoved(name, sceneName, sceneItemId)
+
+    def ownerScenes(self, sceneItem):
+        """
+        Returns the top-level scenes an item lives in (its own scene, or every
+        scene holding its group) and whether it sits inside a group.
+        """
+        sceneName = obs.obs_source_get_name(obs.obs_scene_get_source(obs.obs_sceneitem_get_scene(sceneItem)))
+        if sceneName in self.groupOwners:
+            return self.groupOwners[sceneName], True
+        return [sceneName], False
+
+    def watch(self, name, source):
+        if name not in self.handlers:
+            handler = obs.obs_source_get_signal_handler(source)
+            obs.signal_handler_connect(handler, "item_add", sceneItemAdded)
+            obs.signal_handler_connect(handler, "item_remove", sceneItemRemoved)
+            self.handlers[name] = handler
+
+    def sceneFor(self, source):
+        return self.sceneForTarget(source.target, source.targetSceneName)
+
+    def sceneForTarget(self, target, targetSceneName):
+        if target == TARGET_PREVIEW:
+            return self.previewScene
+        if target == TARGET_SCENE:
+            return targetSceneName
+        # All Scenes moves the program scene's item and links the rest.
+        return self.currentScene
+
+    def linkedItems(self, source):
+        # Every other scene's item for the source, in the order the scenes were indexed.
+        # Items inside a group are positioned relative to it, so canvas positions would misplace them.
+        # item_add and item_remove update the index from the UI thread, so walk a snapshot.
+        return [sceneItem for sceneName, sceneItem in list(self.items.get(source.name, {}).items())
+                if sceneName != source.sceneName and (source.name, sceneName) not in self.nested]
+
+    def findById(self, sceneName, sceneItemId):
+        if not self.built:
+            self.build()
+        entry = self.ids.get(sceneName, {}).get(sceneItemId)
+        if entry is not None:
+            return entry[1]
+        sceneItem = None
+        if sceneName in self.scenes:
+            # Items inside groups are only found by walking the group, which the index already did.
+            sceneItem = obs.obs_scene_find_sceneitem_by_id(self.scenes[sceneName], sceneItemId)
+            if sceneItem is not None:
+                name = obs.obs_source_get_name(obs.obs_sceneitem_get_source(sceneItem))
+                self.ids.setdefault(sceneName, {})[sceneItemId] = (name, sceneItem)
+        return sceneItem
+
+    def find(self, name, sceneName):
+        if not self.built:
+            self.build()
+        sceneItem = self.items.get(name, {}).get(sceneName)
+        if sceneItem is None and sceneName in self.scenes:
+            # Not indexed (e.g. added before we were watching), so ask OBS and remember the answer.
+            sceneItem = obs.obs_scene_find_source_recursive(self.scenes[sceneName], name)
+            if sceneItem is not None:
+                self.items.setdefault(name, {})[sceneName] = sceneItem
+                if self.ownerScenes(sceneItem)[1]:
+                    self.nested.add((name, sceneName))
+        return sceneItem
+
+    def clear(self):
+        for handler in self.handlers.values():
+            obs.signal_handler_disconnect(handler, "item_add", sceneItemAdded)
+            obs.signal_handler_disconnect(handler, "item_remove", sceneItemRemoved)
+        self.handlers.clear()
+        self.items.clear()
+        self.ids.clear()
+        self.scenes.clear()
+        self.groupOwners.clear()
+        self.nested.clear()
+        self.built = False
+
+class CanvasClass:
+    """
+    Canvas base resolution and frame rate, read once and refreshed only when
+    OBS resets video (e.g. the user changes the canvas in Settings).
+    """
+    def __init__(self):
+        self.width = 0
+        self.height = 0
+        self.fpsNum = 0
+        self.fpsDen = 0
+        self.handler = None
+
+    def refresh(self):
+        ovi = obs.obs_video_info()
+        if obs.obs_get_video_info(ovi):
+            self.width = ovi.base_width
+            self.height = ovi.base_height
+            self.fpsNum = ovi.fps_num
+            self.fpsDen = ovi.fps_den
+
+    def ready(self):
+        return self.width > 0 and self.height > 0
+
+    def watch(self):
+        if self.handler is None:
+            self.handler = obs.obs_get_signal_handler()
+            obs.signal_handler_connect(self.handler, "video_reset", videoReset)
+
+    def unwatch(self):
+        if self.handler is not None:
+            obs.signal_handler_disconnect(self.handler, "video_reset", videoReset)
+            self.handler = None
+
+class CommandIndexClass:
+    """
+    Dispatch index built from the configured animations so an incoming command
+    resolves without scanning every animation.
+    """
+    def __init__(self):
+        # Commands arrive as raw datagram bytes, so every key is pre-encoded.
+        self.prefixes = dict((prefix.encode("utf-8"), index) for prefix, index in Direction.Prefixes.items())
+        # Exact command -> [(animation, dispatch action)]
+        self.exact = {}
+        # PositionFreeAll command suffix -> [(animation, dispatch action)]
+        self.suffix = {}
+        # Distinct suffix lengths, so a lookup only probes one slice per length.
+        self.suffixLengths = []
+
+    def build(self, animations):
+        self.exact = {}
+        self.suffix = {}
+        for animation in animations:
+            if animation.variationType == VARIATION_POSITION_FREE_ALL:
+                self.addEntry(self.suffix, animation.command, animation, DISPATCH_START)
+                self.addEntry(self.suffix, animation.stopCommand, animation, DISPATCH_STOP)
+            else:
+                self.addEntry(self.exact, animation.command, animation, DISPATCH_START)
+                if animation.variationType == VARIATION_POSITION_FREE or animation.variationType == VARIATION_SIZE_FREE:
+                    self.addEntry(self.exact, animation.stopCommand, animation, DISPATCH_STOP)
+        self.suffixLengths = sorted(set(len(key) for key in self.suffix))
+
+    def addEntry(self, index, key, animation, action):
+        # An empty command would match every datagram, so it is never indexed.
+        if key:
+            index.setdefault(key.encode("utf-8"), []).append((animation, action))
+
+    def lookup(self, command):
+        """
+        Returns [(animation, action, direction)] in animation order. direction is
+        the parsed prefix index for PositionFreeAll commands and None otherwise.
+        """
+        matches = [(animation, action, None) for animation, action in self.exact.get(command, ())]
+        for length in self.suffixLengths:
+            if length > len(command):
+                break
+            entries = self.suffix.get(command[-length:])
+            if entries is not None:
+                direction = self.prefixes.get(command[:-length])
+                for animation, action in entries:
+                    matches.append((animation, action, direction))
+
+        if len(matches) > 1:
+            # Keep the old scan semantics: animations run in order and a start wins over a stop.
+            matches.sort(key=lambda match: (match[0].animationIndex, match[1]))
+            unique = []
+            for match in matches:
+                if not unique or unique[-1][0] is not match[0]:
+                    unique.append(match)
+            matches = unique
+        return matches
+
+class CommandQueueClass:
+    """
+    Bounded single-producer/single-consumer queue handing commands from the
+    server thread to the OBS timer thread. deque append/popleft are atomic, so
+    neither side takes a lock.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.commands = collections.deque()
+        self.droppedCount = 0
+
+    def push(self, command):
+        # Only the producer grows the deque, so this length check can't race another push.
+        if len(self.commands) >= self.capacity:
+            self.droppedCount += 1
+            return False
+        self.commands.append(command)
+        return True
+
+    def pushMany(self, commands):
+        space = self.capacity - len(self.commands)
+        if len(commands) > space:
+            self.droppedCount += len(commands) - max(space, 0)
+            commands = commands[:max(space, 0)]
+        self.commands.extend(commands)
+
+    def drain(self, handler):
+        # Only drain what is queued right now so a busy producer can't stall the tick.
+        commands = self.commands
+        for _ in range(len(commands)):
+            handler(commands.popleft())
+
+    def clear(self):
+        self.commands.clear()
+
+class TickTimerClass:
+    """
+    Keeps adjustCameraTick registered at the tick rate for as long as the
+    server is up, including while nothing is animating. Sleeping while idle
+    would need the timer re-armed when a command arrives, and only the server
+    thread knows that; adding a timer from it can deadlock against the
+    graphics thread, which holds the timer lock while waiting for the GIL.
+    An idle tick therefore only checks two empty containers and returns. The
+    timer is removed once the server has stopped.
+    """
+    def __init__(self):
+        self.running = False
+        self.interval = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if not self.running:
+                self.running = True
+                self.interval = UpdateRateMs
+                obs.timer_add(adjustCameraTick, UpdateRateMs)
+
+    def settle(self):
+        # Follow a change of tick rate.
+        with self.lock:
+            if self.running and self.interval != UpdateRateMs:
+                obs.timer_remove(adjustCameraTick)
+                obs.timer_add(adjustCameraTick, UpdateRateMs)
+                self.interval = UpdateRateMs
+
+    def stop(self):
+        with self.lock:
+            if self.running:
+                self.running = False
+                obs.timer_remove(adjustCameraTick)
 
 Variation = VariationType()
 Direction = DirectionType()
 Server = ServerClass()
-Source = SourceClass()
+EasingTables = EasingTablesClass()
+Motion = MotionStateClass()
+Sources = SourceRegistryClass()
+BaseSizes = BaseSizeCacheClass()
+Canvas = CanvasClass()
+SceneItems = SceneItemIndexClass()
+CommandIndex = CommandIndexClass()
+CommandQueue = CommandQueueClass(CommandQueueCapacity)
+TickTimer = TickTimerClass()
+
+# paramMask -> struct for its float parameters, compiled on first use.
+BinaryParameterStructs = {}
+
+def ProcessCommand(command):
+    if command[0] == BINARY_MAGIC:
+        ProcessBinaryCommand(command)
+    elif b"\n" in command:
+        for line in command.split(b"\n"):
+            line = line.rstrip(b"\r")
+            if line:
+                ProcessTextCommand(line)
+    else:
+        ProcessTextCommand(command)
+
+def ProcessTextCommand(command):
+    for animation, action, direction in CommandIndex.lookup(command):
+        if animation.variationType == VARIATION_POSITION_FREE_ALL:
+            if action == DISPATCH_START:
+                if direction is not None:
+                    animation.posDirection = direction
+                StartAnimation(animation)
+            else:
+                StopAnimation(animation)
+        elif action == DISPATCH_START:
+            StartAnimation(animation)
+            print("Command ", command.decode("utf-8", "replace"), " available and now executing!")
+        else:
+            print("Stop Command ", command.decode("utf-8", "replace"), " available and now executing!")
+            StopAnimation(animation)
 
-def ProcessCommand(command, animations):
-    for i in range(animationCount):
-        if animations[i].command == command:
-            Source.processingAnimation = True
-            ProcessAnimation(animations[i])
-            print("Command ", command, " available and now executing!")
-        elif ((animations[i].variationType == VARIATION_POSITION_FREE or animations[i].variationType == VARIATION_SIZE_FREE) and animations[i].stopCommand == command):
-            print("Stop Command ", command, " available and now executing!")
-            Source.targetPos = Source.pos
-            Source.processingAnimation = False
-        elif animations[i].variationType == VARIATION_POSITION_FREE_ALL:
-            commandSuffix = animations[i].command
-            stopCommandSuffix = animations[i].stopCommand
-            if command.endswith(commandSuffix):
-                direction = command[:-len(commandSuffix)]
-                if direction == "Up":
-                    animations[i].posDirection = Direction.UP_INDEX
-                elif direction == "Down":
-                    animations[i].posDirection = Direction.DOWN_INDEX
-                elif direction == "Left":
-                    animations[i].posDirection = Direction.LEFT_INDEX
-                elif direction == "Right":
-                    animations[i].posDirection = Direction.RIGHT_INDEX
-
-                elif direction == "UpLeft" or direction == "Up_Left":
-                    animations[i].posDirection = Direction.UP_LEFT_INDEX
-                elif direction == "UpRight" or direction == "Up_Right":
-                    animations[i].posDirection = Direction.UP_RIGHT_INDEX
-                elif direction == "DownLeft" or direction == "Down_Left":
-                    animations[i].posDirection = Direction.DOWN_LEFT_INDEX
-                elif direction == "DownRight" or direction == "Down_Right":
-                    animations[i].posDirection = Direction.DOWN_RIGHT_INDEX
-                Source.processingAnimation = True
-                ProcessAnimation(animations[i])
-            elif command.endswith(stopCommandSuffix):
-                Source.targetPos = Source.pos
-                Source.processingAnimation = False
-
-def ProcessAnimation(animation):
+def ProcessBinaryCommand(command):
+    if len(command) < BinaryHeader.size:
+        print("Binary command too short: %s bytes" % (len(command)))
+        return
+    magic, version, opcode, paramMask, animationIndex = BinaryHeader.unpack_from(command)
+    if version != BINARY_VERSION:
+        print("Unsupported binary command version %s" % (version))
+        return
+    if opcode == OPCODE_BATCH:
+        ProcessBinaryBatch(command, animationIndex)
+        return
+    if animationIndex >= len(Animations):
+        print("Binary command for unknown animation %s" % (animationIndex))
+        return
+
+    animation = Animations[animationIndex]
+    offset = BinaryHeader.size
+    if opcode == OPCODE_START_ITEM or opcode == OPCODE_STOP_ITEM:
+        if len(command) < offset + BinarySceneItemId.size:
+            print("Binary command missing scene item id")
+            return
+        sceneItemId, = BinarySceneItemId.unpack_from(command, offset)
+        offset += BinarySceneItemId.size
+        # Every id gets its own source and motion slot, so only real items are accepted.
+        if SceneItems.findById(SceneItems.sceneForTarget(animation.target, animation.targetSceneName), sceneItemId) is None:
+            print("Binary command for unknown scene item %s" % (sceneItemId))
+            return
+        # Overrides only apply to this trigger, the configured animation is left alone.
+        animation = copy.copy(animation)
+        animation.sceneItemId = sceneItemId
+
+    if opcode == OPCODE_START or opcode == OPCODE_START_ITEM:
+        if paramMask:
+            parameterStruct = BinaryParameterStructs.get(paramMask)
+            if parameterStruct is None:
+                parameterStruct = struct.Struct("<%sf" % (bin(paramMask).count("1")))
+                BinaryParameterStructs[paramMask] = parameterStruct
+            if len(command) < offset + parameterStruct.size:
+                print("Binary command missing parameters for mask %s" % (paramMask))
+                return
+            values = parameterStruct.unpack_from(command, offset)
+            # A NaN or inf would poison the motion arrays for every source, so the whole frame is dropped.
+            if not all(math.isfinite(value) for value in values):
+                print("Binary command has a non-finite parameter, ignoring it")
+                return
+            overrides = []
+            for (bit, attribute), value in zip([parameter for parameter in BinaryParameters if paramMask & parameter[0]], values):
+                if attribute in BinaryIntegerParameters:
+                    if not 0 <= value < BinaryIntegerParameters[attribute]:
+                        print("Binary command %s %s out of range, ignoring it" % (attribute, value))
+                        return
+                    value = int(value)
+                elif value < BinaryParameterMinimums.get(attribute, value):
+                    # A negative duration or non-positive speed gives a rate that never finishes.
+                    print("Binary command %s %s below %s, ignoring it" % (attribute, value, BinaryParameterMinimums[attribute]))
+                    return
+                overrides.append((attribute, value))
+            if animation is Animations[animationIndex]:
+                animation = copy.copy(animation)
+            for attribute, value in overrides:
+                setattr(animation, attribute, value)
+        StartAnimation(animation)
+    elif opcode == OPCODE_STOP or opcode == OPCODE_STOP_ITEM:
+        StopAnimation(animation)
+    else:
+        print("Unknown binary opcode %s" % (opcode))
+
+def ProcessBinaryBatch(command, frameCount):
+    view = memoryview(command)
+    offset = BinaryHeader.size
+    for i in range(frameCount):
+        if offset + BinaryFrameLength.size > len(view):
+            print("Binary batch truncated after %s of %s frames" % (i, frameCount))
+            return
+        length, = BinaryFrameLength.unpack_from(view, offset)
+        offset += BinaryFrameLength.size
+        frame = view[offset:offset + length]
+        offset += length
+        if len(frame) < BinaryHeader.size or frame[0] != BINARY_MAGIC:
+            print("Malformed frame %s in binary batch" % (i))
+            return
+        # Batches don't nest.
+        if frame[2] == OPCODE_BATCH:
+            print("Nested binary batch ignored")
+            continue
+        ProcessBinaryCommand(frame)
+
+def StartAnimation(animation):
+    source = Sources.forAnimation(animation)
+    # Without an item there is no transform to start from.
+    if getSceneItem(source) is None:
+        return
+    moving = source.processingAnimation
+    Sources.start(source)
+    ProcessAnimation(source, animation)
+    Motion.compile(source, moving)
+    source.initialized = True
+    # ProcessAnimation just read the item from OBS.
+    source.needsResync = False
+
+def StopAnimation(animation):
+    source = Sources.forAnimation(animation)
+    source.targetPos = source.pos
+    if source.processingAnimation and source.kinematic:
+        # Free movement slows down at its deceleration; the tick ends it once it is at rest.
+        Motion.brake(source.slot)
+    else:
+        Sources.stop(source)
+
+def ProcessAnimation(source, animation):
     if animation.variationType == VARIATION_POSITION_FREE or animation.variationType == VARIATION_POSITION_FREE_ALL:
-        ProcessPositionFreeAnimation(animation)
-        Source.GetXAndYForce(animation.movementType, animation.duration)
+        ProcessPositionFreeAnimation(source, animation)
     elif animation.variationType == VARIATION_POSITION:
-        InitializeSource(animation, True, False)
-        Source.GetXAndYForce(animation.movementType, animation.duration)
+        InitializeSource(source, animation, True, False)
+        source.GetPositionRate(animation.movementType, animation.duration)
     elif animation.variationType == VARIATION_SIZE or animation.variationType == VARIATION_BOTH:
-        InitializeSource(animation, animation.variationType == VARIATION_BOTH, True)
+        InitializeSource(source, animation, animation.variationType == VARIATION_BOTH, True)
 
         if animation.changeSizeInPlace:
-            Source.targetPos.x -= int(math.floor((Source.targetSize.x - Source.size.x) / 2))
-            Source.targetPos.y -= int(math.floor((Source.targetSize.y - Source.size.y) / 2))
+            source.targetPos.x -= int(math.floor((source.targetSize.x - source.size.x) / 2))
+            source.targetPos.y -= int(math.floor((source.targetSize.y - source.size.y) / 2))
 
         if animation.variationType == VARIATION_BOTH or animation.changeSizeInPlace:
-            Source.GetXAndYForce(MOVEMENT_DURATION, animation.duration)
-        Source.GetXAndYScaleForce(animation.duration)
+            source.GetPositionRate(MOVEMENT_DURATION, animation.duration)
+        source.GetScaleRate(animation.duration)
         
-def InitializeSource(animation, positionSpecified, sizeSpecified):
-    #scene_item = None
-    global source_name
-    scene_item = getSceneItem()
-    #scene_item = findSceneItem(source_name)
+def InitializeSource(source, animation, positionSpecified, sizeSpecified):
+    scene_item = getSceneItem(source)
     print("InitializeSource::scene_item: %s" % (scene_item))
     if scene_item != None:
         posV = obs.vec2()
@@ -344,62 +1870,54 @@ def InitializeSource(animation, positionSpecified, sizeSpecified):
 
         obs.obs_sceneitem_get_pos(scene_item, posV)
         obs.obs_sceneitem_get_scale(scene_item, scaleV) 
-        Source.scale.x = scaleV.x
-        Source.scale.y = scaleV.y
-        width, height = calculateSize(scene_item, Source.scale.x, Source.scale.y)
-        Source.pos = posV
-        Source.size.x = width
-        Source.size.y = height
+        source.scale.x = scaleV.x
+        source.scale.y = scaleV.y
+        width, height = calculateSize(source, source.scale.x, source.scale.y)
+        source.pos = posV
+        source.size.x = width
+        source.size.y = height
         
-        Source.posSpeed = animation.posSpeed
+        source.posSpeed = animation.posSpeed
+        source.posRate = InstantRate
+        source.scaleRate = InstantRate
+        source.easingRow = EasingTables.rowFor(animation)
+        source.subPixel = animation.subPixel
+        source.linked = animation.linked or animation.target == TARGET_ALL
+        source.kinematic = False
+        source.spring = animation.springFollow
+        source.springStiffness = animation.springStiffness
+        source.springDamping = animation.springDamping
+        source.edgeBehavior = animation.edgeBehavior
+        source.edgeMargin = animation.edgeMargin
+        source.baseSize = BaseSizes.get(source)
         if positionSpecified:
-            Source.targetPos.x = animation.destinationX
-            Source.targetPos.y = animation.destinationY
+            source.targetPos.x = animation.destinationX
+            source.targetPos.y = animation.destinationY
         else:
-            Source.targetPos.x = posV.x
-            Source.targetPos.y = posV.y
+            source.targetPos.x = posV.x
+            source.targetPos.y = posV.y
 
         if sizeSpecified:
-            Source.targetSize.x = animation.destinationWidth
-            Source.targetSize.y = animation.destinationHeight
-            scaleV.x, scaleV.y = calculateNewScale(scene_item, Source.targetSize.x, Source.targetSize.y)
-            Source.targetScale.x = scaleV.x
-            Source.targetScale.y = scaleV.y
+            source.targetSize.x = animation.destinationWidth
+            source.targetSize.y = animation.destinationHeight
+            scaleV.x, scaleV.y = calculateNewScale(source, source.targetSize.x, source.targetSize.y)
+            source.targetScale.x = scaleV.x
+            source.targetScale.y = scaleV.y
         else:
-            Source.targetSize.x = Source.size.x
-            Source.targetSize.y = Source.size.y
-            Source.targetScale.x = Source.scale.x
-            Source.targetScale.y = Source.scale.y
+            source.targetSize.x = source.size.x
+            source.targetSize.y = source.size.y
+            source.targetScale.x = source.scale.x
+            source.targetScale.y = source.scale.y
         
-def ProcessPositionFreeAnimation(animation):
-    InitializeSource(animation, True, False)
-
-    # Determine direction.
-    if animation.posDirection == Direction.UP_INDEX:
-        Source.targetPos.y -= 5000
-        Source.targetPos.x = Source.pos.x
-    elif animation.posDirection == Direction.DOWN_INDEX:
-        Source.targetPos.y += 5000
-        Source.targetPos.x = Source.pos.x
-    elif animation.posDirection == Direction.RIGHT_INDEX:
-        Source.targetPos.x += 5000
-        Source.targetPos.y = Source.pos.y
-    elif animation.posDirection == Direction.LEFT_INDEX:
-        Source.targetPos.x -= 5000
-        Source.targetPos.y = Source.pos.y
-
-    elif animation.posDirection == Direction.DOWN_LEFT_INDEX:
-        Source.targetPos.x = Source.pos.x - 5000
-        Source.targetPos.y = Source.pos.y + 5000
-    elif animation.posDirection == Direction.DOWN_RIGHT_INDEX:
-        Source.targetPos.x = Source.pos.x + 5000
-        Source.targetPos.y = Source.pos.y + 5000
-    elif animation.posDirection == Direction.UP_RIGHT_INDEX:
-        Source.targetPos.x = Source.pos.x + 5000
-        Source.targetPos.y = Source.pos.y - 5000
-    elif animation.posDirection == Direction.UP_LEFT_INDEX:
-        Source.targetPos.x = Source.pos.x - 5000
-        Source.targetPos.y = Source.pos.y - 5000
+def ProcessPositionFreeAnimation(source, animation):
+    InitializeSource(source, animation, False, False)
+
+    # Heads in the animation's direction at up to its speed until a stop command arrives.
+    source.kinematic = True
+    source.spring = False
+    source.heading = Direction.Headings.get(animation.posDirection, (0.0, 0.0))
+    source.acceleration = animation.acceleration
+    source.deceleration = animation.deceleration
 
 def SetDestinationPositionAndSize(props, p):
     global Animations
@@ -409,14 +1927,39 @@ def SetDestinationPositionAndSize(props, p):
     indexStr = re.sub("[^0-9]", "", name)
     
     animationIndex = int(indexStr)
-    scene_item = getSceneItem()
+    animation = Animations[animationIndex]
+    # This runs on the UI thread while the tick may be using the motion arrays
+    # and the registries, so ask OBS directly rather than registering a source.
+    if animation.target == TARGET_SCENE:
+        sceneName = animation.targetSceneName
+    elif animation.target == TARGET_PREVIEW:
+        sceneName = findPreviewSceneName()
+    else:
+        sceneName = findCurrentSceneName()
+    sceneSource = obs.obs_get_source_by_name(sceneName)
+    if sceneSource is None:
+        print("No scene %s to read the destination from" % (sceneName))
+        return
+    scene = obs.obs_scene_from_source(sceneSource)
+    if animation.sceneItemId:
+        scene_item = obs.obs_scene_find_sceneitem_by_id(scene, animation.sceneItemId)
+    else:
+        scene_item = obs.obs_scene_find_source_recursive(scene, animation.sourceName or source_name)
+    if scene_item is None:
+        obs.obs_source_release(sceneSource)
+        print("No scene item for animation %s in %s" % (animationIndex, sceneName))
+        return
 
     posV = obs.vec2()
     scaleV = obs.vec2()
     obs.obs_sceneitem_get_pos(scene_item, posV)
     obs.obs_sceneitem_get_scale(scene_item, scaleV) 
+    src = obs.obs_sceneitem_get_source(scene_item)
+    width = (int)(obs.obs_source_get_base_width(src) * scaleV.x)
+    height = (int)(obs.obs_source_get_base_height(src) * scaleV.y)
+    # The scene item is borrowed from the scene, so it is only used while the scene is held.
+    obs.obs_source_release(sceneSource)
 
-    width, height = calculateSize(scene_item, scaleV.x, scaleV.y)
     Animations[animationIndex].destinationX = posV.x
     Animations[animationIndex].destinationY = posV.y
     Animations[animationIndex].destinationWidth = width
@@ -427,109 +1970,187 @@ def SetDestinationPositionAndSize(props, p):
     obs.obs_data_set_int(settings, Animations[animationIndex].destinationHeightStorage, (int)(Animations[animationIndex].destinationHeight))
 
 def adjustCameraTick():
-    global source_name
-    global source_pos
     global UpdatesPerSecond
-    global scene_item
+    global lastTickTime
 
-    # Do not control any aspect of the source if no animation is currently playing or if the server is not connected. 
-    if (not Source.processingAnimation) or (not Server.run) or scene_item is None:
+    # Nothing queued and nothing moving: return before any other work.
+    if Server.run and not CommandQueue.commands and not Sources.active:
+        lastTickTime = None
         return
 
-    #scene_item = findSceneItem(source_name)
-    # Only make adjustments if our server is currently running.
-    #print("adjustCameraTick::scene_item: %s" % (scene_item))
-    
+    # Apply every command received since the last tick before advancing, so
+    # OBS state is only ever touched from this thread.
+    CommandQueue.drain(ProcessCommand)
+
+    # Do not control any aspect of the sources if the server is not connected,
+    # and stop ticking altogether until check_Server brings it back.
+    sources = [source for source in Sources.active.values() if source.sceneItem is not None]
+    if not Server.run or not sources:
+        lastTickTime = None
+        if not Server.run:
+            TickTimer.stop()
+        return
+
+    # Integrate over the time that actually passed, since the timer slips under
+    # encode load. The first tick of a new animation assumes one nominal interval.
+    now = time.monotonic()
+    if lastTickTime is None:
+        dt = 1.0 / UpdatesPerSecond
+    else:
+        dt = now - lastTickTime
+    lastTickTime = now
+
+    # The motion arrays are the source of truth while animating. OBS is only
+    # read back when someone else moved the item.
+    for source in sources:
+        if source.needsResync:
+            readTransform(source)
+
+    finished, posDirty, scaleDirty = Motion.advance([source.slot for source in sources], dt)
+
+    for source, done, writePos, writeScale in zip(sources, finished, posDirty, scaleDirty):
+        if done:
+            Sources.stop(source)
+
+        # Update the position and size of the source based on speed, writing
+        # only what changed.
+        if writePos:
+            source.pos.x = Motion.posX[source.slot]
+            source.pos.y = Motion.posY[source.slot]
+        if writeScale:
+            source.scale.x = Motion.scaleX[source.slot]
+            source.scale.y = Motion.scaleY[source.slot]
+        writeTransform(source.sceneItem, source.pos, source.scale, writePos, writeScale)
+        if source.linked and (writePos or writeScale):
+            for sceneItem in SceneItems.linkedItems(source):
+                writeTransform(sceneItem, source.pos, source.scale, writePos, writeScale)
+
+def writeTransform(sceneItem, pos, scale, writePos, writeScale):
+    # Each set recomputes the item's transform in OBS, so two sets share one deferred update.
+    if writePos and writeScale:
+        obs.obs_sceneitem_defer_update_begin(sceneItem)
+        obs.obs_sceneitem_set_pos(sceneItem, pos)
+        obs.obs_sceneitem_set_scale(sceneItem, scale)
+        obs.obs_sceneitem_defer_update_end(sceneItem)
+    elif writePos:
+        obs.obs_sceneitem_set_pos(sceneItem, pos)
+    elif writeScale:
+        obs.obs_sceneitem_set_scale(sceneItem, scale)
+
+def readTransform(source):
     posV = obs.vec2()
     scaleV = obs.vec2()
+    obs.obs_sceneitem_get_pos(source.sceneItem, posV)
+    obs.obs_sceneitem_get_scale(source.sceneItem, scaleV)
+    Motion.posX[source.slot] = posV.x
+    Motion.posY[source.slot] = posV.y
+    Motion.scaleX[source.slot] = scaleV.x
+    Motion.scaleY[source.slot] = scaleV.y
+    Motion.rebase(source.slot)
+    source.needsResync = False
+
+def itemTransformed(calldata):
+    item = obs.calldata_sceneitem(calldata, "item")
+    name = obs.obs_source_get_name(obs.obs_sceneitem_get_source(item))
+    sceneItemId = obs.obs_sceneitem_get_id(item)
+    posV = None
+    # This can run on whichever thread moved the item while a tick changes the
+    # active sources, so walk a snapshot. Ids are only unique per scene, so a
+    # match elsewhere just costs one extra read.
+    for source in list(Sources.active.values()):
+        if source.name != name or source.sceneItemId != sceneItemId:
+            continue
+        if posV is None:
+            posV = obs.vec2()
+            scaleV = obs.vec2()
+            obs.obs_sceneitem_get_pos(item, posV)
+            obs.obs_sceneitem_get_scale(item, scaleV)
+        # OBS applies our writes later in the frame and signals them too; only
+        # react when the item is somewhere other than where we put it.
+        slot = source.slot
+        if (abs(posV.x - Motion.writtenX[slot]) > EchoTolerance or abs(posV.y - Motion.writtenY[slot]) > EchoTolerance or
+                abs(scaleV.x - Motion.writtenScaleX[slot]) > EchoTolerance or abs(scaleV.y - Motion.writtenScaleY[slot]) > EchoTolerance):
+            source.needsResync = True
+
+def updateTickRate():
+    """
+    Ticks at the canvas frame rate when Tick At Canvas Frame Rate is set,
+    otherwise at the default rate.
+    """
+    global UpdatesPerSecond
+    global UpdateRateMs
 
-    obs.obs_sceneitem_get_pos(scene_item, posV)
-    obs.obs_sceneitem_get_scale(scene_item, scaleV) 
-    width, height = calculateSize(scene_item, Source.scale.x, Source.scale.y)
-    Source.pos = posV
-    Source.size.x = width
-    Source.size.y = height 
-
-    if Source.pos.x != Source.targetPos.x:
-        fractionX = (float(Source.forceX) / float(UpdatesPerSecond)) + Source.posRemainder.x
-        integerX = int(math.floor(fractionX))
-        Source.posRemainder.x = fractionX - integerX
-        Source.pos.x += integerX
-        if (integerX > 0 and Source.pos.x > Source.targetPos.x) or (integerX < 0 and Source.pos.x < Source.targetPos.x):
-            Source.pos.x = Source.targetPos.x
-
-    if Source.pos.y != Source.targetPos.y:
-        fractionY = (Source.forceY / UpdatesPerSecond) + Source.posRemainder.y
-        integerY = int(math.floor(fractionY))
-        Source.posRemainder.y = fractionY - integerY
-        Source.pos.y += integerY
-        if (integerY > 0 and Source.pos.y > Source.targetPos.y) or (integerY < 0 and Source.pos.y < Source.targetPos.y):
-            Source.pos.y = Source.targetPos.y
-
-    if Source.scale.x != Source.targetScale.x:
-        fractionX = (float(Source.forceW) / float(UpdatesPerSecond))
-        Source.scale.x += fractionX
-        if (fractionX > 0 and Source.scale.x > Source.targetScale.x) or (fractionX < 0 and Source.scale.x < Source.targetScale.x):
-            Source.scale.x = Source.targetScale.x
-
-    if Source.scale.y != Source.targetScale.y:
-        fractionY = (float(Source.forceH) / float(UpdatesPerSecond))
-        Source.scale.y += fractionY
-        if (fractionY > 0 and Source.scale.y > Source.targetScale.y) or (fractionY < 0 and Source.scale.y < Source.targetScale.y):
-            Source.scale.y = Source.targetScale.y
-
-    if Source.pos.x == Source.targetPos.x and Source.pos.y == Source.targetPos.y and Source.scale.x == Source.targetScale.x and Source.scale.y == Source.targetScale.y:
-        Source.processingAnimation = False
-
-    # Update the position and size of the source based on speed/
-    obs.obs_sceneitem_set_pos(scene_item, Source.pos)
-    obs.obs_sceneitem_set_scale(scene_item, Source.scale)
-
-def getSceneItem():
-    global scene_item
-    global source_name
-    print("Current Scene Item: %s, source name: %s" % (scene_item, source_name))
-    if scene_item is None:
+    UpdatesPerSecond = DefaultUpdatePerSecond
+    if tickFollowsCanvas and Canvas.fpsNum > 0 and Canvas.fpsDen > 0:
+        UpdatesPerSecond = float(Canvas.fpsNum) / Canvas.fpsDen
+    UpdateRateMs = max(1, int(1000/UpdatesPerSecond))
+    TickTimer.settle()
+
+def videoReset(calldata):
+    Canvas.refresh()
+    updateTickRate()
+
+def getSceneItem(source):
+    print("Current Scene Item: %s, source name: %s" % (source.sceneItem, source.name))
+    if source.sceneItem is None:
        print("Before finding scene item")
-       scene_item = findSceneItem(source_name)
-       print("Current Scene Item: %s, source name: %s" % (scene_item, source_name))
-    return scene_item
+       Sources.attach(source, findSceneItem(source))
+       print("Current Scene Item: %s, source name: %s" % (source.sceneItem, source.name))
+    return source.sceneItem
 
 def findCurrentSceneName():
+    sceneName = ""
     try:
         sceneSource = obs.obs_frontend_get_current_scene()
+        sceneName = obs.obs_source_get_name(sceneSource)
+        obs.obs_source_release(sceneSource)
     except Exception as e: 
         print("Handling exception: %s" % (e))
-    return obs.obs_source_get_name(sceneSource)
-
-def findSceneItem(source_name):
-    scene_item = None
-    currentSceneName = findCurrentSceneName()
-    if currentSceneName:
-        src = obs.obs_get_source_by_name(currentSceneName)
-        if src:
-            scene = obs.obs_scene_from_source(src)
-            if scene:   
-                scene_item = obs.obs_scene_find_source(scene, source_name) 
-        obs.obs_scene_release(scene)
-        obs.obs_source_release(src)
-        return scene_item
-
-
-def calculateSize(scene_item, scaleX, scaleY):
-    src = obs.obs_sceneitem_get_source(scene_item)
-    baseWidth = obs.obs_source_get_base_width(src)
-    baseHeight = obs.obs_source_get_base_height(src)
+    return sceneName
 
-    return (int)(baseWidth * scaleX), (int)(baseHeight * scaleY)
+def findPreviewSceneName():
+    # Without studio mode the preview is the program.
+    sceneName = ""
+    try:
+        sceneSource = obs.obs_frontend_get_current_preview_scene()
+        if sceneSource is not None:
+            sceneName = obs.obs_source_get_name(sceneSource)
+            obs.obs_source_release(sceneSource)
+    except Exception as e: 
+        print("Handling exception: %s" % (e))
+    return sceneName or findCurrentSceneName()
+
+def findSceneItem(source):
+    if not SceneItems.built:
+        SceneItems.build()
+    if source.itemId:
+        return SceneItems.findById(SceneItems.sceneFor(source), source.itemId)
+    return SceneItems.find(source.name, SceneItems.sceneFor(source))
+
+def sceneItemAdded(calldata):
+    sceneItem = obs.calldata_sceneitem(calldata, "item")
+    sceneNames, nested = SceneItems.ownerScenes(sceneItem)
+    for sceneName in sceneNames:
+        SceneItems.addItem(sceneName, sceneItem, nested)
+
+def sceneItemRemoved(calldata):
+    sceneItem = obs.calldata_sceneitem(calldata, "item")
+    for sceneName in SceneItems.ownerScenes(sceneItem)[0]:
+        SceneItems.removeItem(sceneName, sceneItem)
 
-def calculateNewScale(item, width, height):
-    src = obs.obs_sceneitem_get_source(item)
 
-    baseWidth = obs.obs_source_get_base_width(src)
-    baseHeight = obs.obs_source_get_base_height(src)
+def calculateSize(source, scaleX, scaleY):
+    baseWidth, baseHeight = BaseSizes.get(source)
+
+    return (int)(baseWidth * scaleX), (int)(baseHeight * scaleY)
+
+def calculateNewScale(source, width, height):
+    baseWidth, baseHeight = BaseSizes.get(source)
     return (width / baseWidth), ( height / baseHeight)
 
+def baseSizeChanged(calldata):
+    BaseSizes.invalidate(obs.obs_source_get_name(obs.calldata_source(calldata, "source")))
+
 def script_properties():
     """
     Called to define user properties associated with the script. These
@@ -544,15 +2165,10 @@ def script_properties():
     p = obs.obs_properties_add_list(props, "source", "Video Source",
                                     obs.OBS_COMBO_TYPE_EDITABLE,
                                     obs.OBS_COMBO_FORMAT_STRING)
-    sources = obs.obs_enum_sources()
-    if sources is not None:
-        for source in sources:
-            source_id = obs.obs_source_get_id(source)
-            if source_id == "dshow_input":
-                name = obs.obs_source_get_name(source)
-                obs.obs_property_list_add_string(p, name, name)
-
-        obs.source_list_release(sources)
+    videoSourceNames = findVideoSourceNames()
+    for name in videoSourceNames:
+        obs.obs_property_list_add_string(p, name, name)
+    sceneNames = obs.obs_frontend_get_scene_names() or []
     ######################################################################
 
     ######################################################################
@@ -560,6 +2176,9 @@ def script_properties():
     ######################################################################
     obs.obs_properties_add_text(props, Server.addressStorage, "Address", obs.OBS_TEXT_DEFAULT)
     obs.obs_properties_add_int(props, Server.portStorage,"Port",0, 99999, 1)
+    obs.obs_properties_add_bool(props, Server.batchedReceiveStorage, "Batched Receive (Drain All Pending Messages)")
+    obs.obs_properties_add_int(props, Server.receiveBufferStorage, "Receive Buffer (KB, 0 = System Default)", 0, 65536, 64)
+    obs.obs_properties_add_bool(props, tickFollowsCanvasStorage, "Tick At Canvas Frame Rate")
     ######################################################################
 
     animationCountProperties = []
@@ -572,93 +2191,210 @@ def script_properties():
     animationCountProperties.append(animationCountProperty)
     obs.obs_property_set_modified_callback(animationCountProperties[0], properties_set_vis)
 
-    customStartingProperties = []
-    variationProperties = []
-    setDestinationValuesButtons = []
-    movementProperties = []
-
-    # For each command, do the following: 
+    edit_list = obs.obs_properties_add_list(props, editAnimationStorage, "Edit Animation", obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(edit_list, "All Animations", EDIT_ALL_ANIMATIONS)
     for i in range(animationCount):
-        index = i
-        obs.obs_properties_add_text(props, "Blocker"+str(i), "------------------Animation " + str(i) + "-------------------", obs.OBS_TEXT_DEFAULT)
-
-        property_list = obs.obs_properties_add_list(props, Animations[i].variationTypeStorage, Variation.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
-        obs.obs_property_list_add_int(property_list, Variation.Position, VARIATION_POSITION)
-        obs.obs_property_list_add_int(property_list, Variation.Size, VARIATION_SIZE)
-        obs.obs_property_list_add_int(property_list, Variation.PositionAndSize, VARIATION_POSITION | VARIATION_SIZE)
-        obs.obs_property_list_add_int(property_list, Variation.PositionFree, VARIATION_POSITION_FREE)
-        obs.obs_property_list_add_int(property_list, Variation.PositionFreeAll, VARIATION_POSITION_FREE_ALL)
-        obs.obs_property_list_add_int(property_list, Variation.SizeFree, VARIATION_SIZE_FREE)
-        variationProperties.append(property_list)
-
-        customStartingProperties.append(obs.obs_properties_add_bool(props, Animations[i].customStartingSettingStorage, "Custom Starting Setting"))
-        
-        obs.obs_property_set_modified_callback(customStartingProperties[index], properties_set_vis)
-        obs.obs_property_set_modified_callback(variationProperties[index], properties_set_vis)
-        # obs.obs_property_set_modified_callback(customStartingProperties[index], properties_set_vis)
-
-        setDestinationValuesButtons.append(obs.obs_properties_add_button(props, Animations[i].setDestinationStorage, "Populate Destination Position And Size (Reload Script To See Change)", SetDestinationPositionAndSize))        
-
-        obs.obs_properties_add_int(props, Animations[i].startingXStorage,"Starting X",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].startingYStorage,"Starting Y",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].destinationXStorage,"Destination X",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].destinationYStorage,"Destination Y",-8192, 8192, 1)
-
-        # Handle movement type:
-        movement_property_list = obs.obs_properties_add_list(props, Animations[i].movementTypeStorage, Movement.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
-        obs.obs_property_list_add_int(movement_property_list, Movement.Speed, MOVEMENT_SPEED)
-        obs.obs_property_list_add_int(movement_property_list, Movement.Duration, MOVEMENT_DURATION)
-        obs.obs_property_list_add_int(movement_property_list, Movement.Quickest, MOVEMENT_QUICKEST)
-
-        obs.obs_properties_add_int(props, Animations[i].durationStorage,"Duration (seconds)",0, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].posSpeedStorage,"Position Speed (Pixels per second)",1, 8192, 1)
-
-        movementProperties.append(movement_property_list)
-
-        obs.obs_property_set_modified_callback(movementProperties[index], properties_set_vis)
+        obs.obs_property_list_add_int(edit_list, "Animation " + str(i), i)
+    obs.obs_property_set_modified_callback(edit_list, properties_set_vis)
+
+    # Building every animation's properties is what makes the dialog slow to
+    # open, so only the edited animation (or every one, on request) is built.
+    builtAnimations.clear()
+    for i in editedAnimations():
+        group = addAnimationProperties(props, Animations[i], videoSourceNames, sceneNames)
+        animationProperties_set_vis(group, Animations[i], Animations[i].variationType, Animations[i].movementType, Animations[i].customStartingSetting, Animations[i].easing, Animations[i].springFollow, Animations[i].target)
+    return props
 
+def addAnimationProperties(props, animation, videoSourceNames, sceneNames):
+    """
+    Adds one animation's properties to props as a group and returns the group.
+    """
+    group = obs.obs_properties_create()
 
-        # Handle pos speed direction
-        direction_list = obs.obs_properties_add_list(props, Animations[i].posDirectionStorage, Direction.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
-        obs.obs_property_list_add_int(direction_list, Direction.Up, Direction.UP_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Down, Direction.DOWN_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Left, Direction.LEFT_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Right, Direction.RIGHT_INDEX)
-        
-        obs.obs_property_list_add_int(direction_list, Direction.Up_Left, Direction.UP_LEFT_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Up_Right, Direction.UP_RIGHT_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Down_Left, Direction.DOWN_LEFT_INDEX)
-        obs.obs_property_list_add_int(direction_list, Direction.Down_Right, Direction.DOWN_RIGHT_INDEX)
+    property_list = obs.obs_properties_add_list(group, animation.variationTypeStorage, Variation.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(property_list, Variation.Position, VARIATION_POSITION)
+    obs.obs_property_list_add_int(property_list, Variation.Size, VARIATION_SIZE)
+    obs.obs_property_list_add_int(property_list, Variation.PositionAndSize, VARIATION_POSITION | VARIATION_SIZE)
+    obs.obs_property_list_add_int(property_list, Variation.PositionFree, VARIATION_POSITION_FREE)
+    obs.obs_property_list_add_int(property_list, Variation.PositionFreeAll, VARIATION_POSITION_FREE_ALL)
+    obs.obs_property_list_add_int(property_list, Variation.SizeFree, VARIATION_SIZE_FREE)
 
-        obs.obs_properties_add_int(props, Animations[i].startingWidthStorage,"Starting Width",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].startingHeightStorage,"Starting Height",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].destinationWidthStorage,"Destination Width",-8192, 8192, 1)
-        obs.obs_properties_add_int(props, Animations[i].destinationHeightStorage,"Destination Height",-8192, 8192, 1)
+    custom_starting_property = obs.obs_properties_add_bool(group, animation.customStartingSettingStorage, "Custom Starting Setting")
+    
+    obs.obs_property_set_modified_callback(custom_starting_property, properties_set_vis)
+    obs.obs_property_set_modified_callback(property_list, properties_set_vis)
+
+    obs.obs_properties_add_button(group, animation.setDestinationStorage, "Populate Destination Position And Size (Reload Script To See Change)", SetDestinationPositionAndSize)
+
+    obs.obs_properties_add_int(group, animation.startingXStorage,"Starting X",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.startingYStorage,"Starting Y",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.destinationXStorage,"Destination X",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.destinationYStorage,"Destination Y",-8192, 8192, 1)
+
+    # Handle movement type:
+    movement_property_list = obs.obs_properties_add_list(group, animation.movementTypeStorage, Movement.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(movement_property_list, Movement.Speed, MOVEMENT_SPEED)
+    obs.obs_property_list_add_int(movement_property_list, Movement.Duration, MOVEMENT_DURATION)
+    obs.obs_property_list_add_int(movement_property_list, Movement.Quickest, MOVEMENT_QUICKEST)
+
+    obs.obs_properties_add_int(group, animation.durationStorage,"Duration (seconds)",0, 8192, 1)
+    obs.obs_properties_add_int(group, animation.posSpeedStorage,"Position Speed (Pixels per second)",1, 8192, 1)
+    obs.obs_properties_add_int(group, animation.accelerationStorage, "Acceleration (Pixels per second², 0 = Instant)", 0, 65536, 10)
+    obs.obs_properties_add_int(group, animation.decelerationStorage, "Deceleration (Pixels per second², 0 = Instant)", 0, 65536, 10)
+
+    obs.obs_property_set_modified_callback(movement_property_list, properties_set_vis)
+
+    easing_list = obs.obs_properties_add_list(group, animation.easingStorage, Easing.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    for easing, easingName in Easing.Names:
+        obs.obs_property_list_add_int(easing_list, easingName, easing)
+    obs.obs_property_set_modified_callback(easing_list, properties_set_vis)
+    obs.obs_properties_add_float(group, animation.bezierX1Storage, "Bezier X1", 0, 1, 0.01)
+    obs.obs_properties_add_float(group, animation.bezierY1Storage, "Bezier Y1", -2, 3, 0.01)
+    obs.obs_properties_add_float(group, animation.bezierX2Storage, "Bezier X2", 0, 1, 0.01)
+    obs.obs_properties_add_float(group, animation.bezierY2Storage, "Bezier Y2", -2, 3, 0.01)
+
+
+    # Handle pos speed direction
+    direction_list = obs.obs_properties_add_list(group, animation.posDirectionStorage, Direction.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(direction_list, Direction.Up, Direction.UP_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Down, Direction.DOWN_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Left, Direction.LEFT_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Right, Direction.RIGHT_INDEX)
+    
+    obs.obs_property_list_add_int(direction_list, Direction.Up_Left, Direction.UP_LEFT_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Up_Right, Direction.UP_RIGHT_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Down_Left, Direction.DOWN_LEFT_INDEX)
+    obs.obs_property_list_add_int(direction_list, Direction.Down_Right, Direction.DOWN_RIGHT_INDEX)
+
+    obs.obs_properties_add_int(group, animation.startingWidthStorage,"Starting Width",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.startingHeightStorage,"Starting Height",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.destinationWidthStorage,"Destination Width",-8192, 8192, 1)
+    obs.obs_properties_add_int(group, animation.destinationHeightStorage,"Destination Height",-8192, 8192, 1)
+
+    obs.obs_properties_add_bool(group, animation.changeSizeInPlaceStorage,"Change Size In Place")
+    obs.obs_properties_add_bool(group, animation.subPixelStorage, "Sub-Pixel Positioning (Smoother Slow Moves)")
+    obs.obs_properties_add_bool(group, animation.linkedStorage, "Linked (Move In Every Scene)")
+    edge_list = obs.obs_properties_add_list(group, animation.edgeBehaviorStorage, Edge.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(edge_list, Edge.None_, EDGE_NONE)
+    obs.obs_property_list_add_int(edge_list, Edge.Stop, EDGE_STOP)
+    obs.obs_property_list_add_int(edge_list, Edge.Bounce, EDGE_BOUNCE)
+    obs.obs_property_list_add_int(edge_list, Edge.Wrap, EDGE_WRAP)
+    obs.obs_properties_add_int(group, animation.edgeMarginStorage, "Canvas Edge Margin (Pixels)", 0, 4096, 1)
+    spring_property = obs.obs_properties_add_bool(group, animation.springFollowStorage, "Spring Follow (New Destinations Keep Momentum)")
+    obs.obs_property_set_modified_callback(spring_property, properties_set_vis)
+    obs.obs_properties_add_float(group, animation.springStiffnessStorage, "Spring Stiffness", 1, 10000, 1)
+    obs.obs_properties_add_float(group, animation.springDampingStorage, "Spring Damping (1 = Critically Damped)", 0.05, 10, 0.05)
+
+    obs.obs_properties_add_text(group, animation.commandStorage, "Command", obs.OBS_TEXT_DEFAULT)
+    obs.obs_properties_add_text(group, animation.stopCommandStorage, "Stop Command", obs.OBS_TEXT_DEFAULT)
+
+    target_list = obs.obs_properties_add_list(group, animation.sourceNameStorage, "Target Source (Blank = Video Source)", obs.OBS_COMBO_TYPE_EDITABLE, obs.OBS_COMBO_FORMAT_STRING)
+    for name in videoSourceNames:
+        obs.obs_property_list_add_string(target_list, name, name)
+
+    scene_target_list = obs.obs_properties_add_list(group, animation.targetStorage, Target.Type, obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    obs.obs_property_list_add_int(scene_target_list, Target.Program, TARGET_PROGRAM)
+    obs.obs_property_list_add_int(scene_target_list, Target.Preview, TARGET_PREVIEW)
+    obs.obs_property_list_add_int(scene_target_list, Target.Scene, TARGET_SCENE)
+    obs.obs_property_list_add_int(scene_target_list, Target.All, TARGET_ALL)
+    obs.obs_property_set_modified_callback(scene_target_list, properties_set_vis)
+    scene_name_list = obs.obs_properties_add_list(group, animation.targetSceneNameStorage, "Scene Name", obs.OBS_COMBO_TYPE_EDITABLE, obs.OBS_COMBO_FORMAT_STRING)
+    for name in sceneNames:
+        obs.obs_property_list_add_string(scene_name_list, name, name)
+    obs.obs_property_set_modified_callback(scene_name_list, properties_set_vis)
+    item_id_list = obs.obs_properties_add_list(group, animation.sceneItemIdStorage, "Scene Item", obs.OBS_COMBO_TYPE_LIST, obs.OBS_COMBO_FORMAT_INT)
+    fillSceneItemList(item_id_list, animation.targetSceneName)
+
+    obs.obs_properties_add_group(props, animation.groupStorage, "Animation " + str(animation.animationIndex), obs.OBS_GROUP_NORMAL, group)
+    builtAnimations.add(animation.animationIndex)
+    return group
+
+def findVideoSourceNames():
+    videoSourceNames = []
+    sources = obs.obs_enum_sources()
+    if sources is not None:
+        for source in sources:
+            source_id = obs.obs_source_get_id(source)
+            if source_id == "dshow_input":
+                videoSourceNames.append(obs.obs_source_get_name(source))
 
-        obs.obs_properties_add_bool(props, Animations[i].changeSizeInPlaceStorage,"Change Size In Place")
+        obs.source_list_release(sources)
+    return videoSourceNames
 
-        obs.obs_properties_add_text(props, Animations[i].commandStorage, "Command", obs.OBS_TEXT_DEFAULT)
-        obs.obs_properties_add_text(props, Animations[i].stopCommandStorage, "Stop Command", obs.OBS_TEXT_DEFAULT)
-        animationProperties_set_vis(props, Animations[i], Animations[i].variationType, Animations[i].movementType, Animations[i].customStartingSetting)
-    return props
+def editedAnimations():
+    if editAnimation == EDIT_ALL_ANIMATIONS:
+        return range(min(animationCount, len(Animations)))
+    if 0 <= editAnimation < min(animationCount, len(Animations)):
+        return [editAnimation]
+    return []
 
 def properties_set_vis(props, p, settings):
     global animationCount
     name = obs.obs_property_name(p)
 
+    if name == editAnimationStorage:
+        return editAnimation_set_vis(props, settings)
+
     if str(name).strip().lower() != "animationcount":
         indexStr = re.sub("[^0-9]", "", name)
         if indexStr == "":
             return False
-        animationIndex = int(indexStr)
-        showStartingProperties = obs.obs_data_get_bool(settings, Animations[animationIndex].customStartingSettingStorage)
-        variationType = obs.obs_data_get_int(settings, Animations[animationIndex].variationTypeStorage)
-        movementType = obs.obs_data_get_int(settings, Animations[animationIndex].movementTypeStorage)
-        animationProperties_set_vis(props, Animations[animationIndex], variationType, movementType, showStartingProperties)
+        # props is the dialog's top-level properties; lookups search into the
+        # groups, of which only the edited animations' exist. Only this
+        # animation is recomputed.
+        animation = Animations[int(indexStr)]
+        if name == animation.targetSceneNameStorage:
+            sceneItemIdProperty = obs.obs_properties_get(props, animation.sceneItemIdStorage)
+            sceneItemIds = fillSceneItemList(sceneItemIdProperty, obs.obs_data_get_string(settings, animation.targetSceneNameStorage))
+            # An id picked in the old scene means a different item, or none, in the new one.
+            if obs.obs_data_get_int(settings, animation.sceneItemIdStorage) not in sceneItemIds:
+                obs.obs_data_set_int(settings, animation.sceneItemIdStorage, 0)
+        animationSettings_set_vis(props, animation, settings)
+
+    return True
 
+def fillSceneItemList(listProperty, sceneName):
+    """
+    Lists the items of one scene by id, since ids are only unique within a
+    scene. Returns the listed ids.
+    """
+    if not SceneItems.built:
+        SceneItems.build()
+    obs.obs_property_list_clear(listProperty)
+    obs.obs_property_list_add_int(listProperty, "By Source Name", 0)
+    sceneItemIds = [0]
+    for sceneItemId, (name, sceneItem) in sorted(SceneItems.ids.get(sceneName, {}).items(), key=lambda entry: entry[0]):
+        obs.obs_property_list_add_int(listProperty, "%s (#%s)" % (name, sceneItemId), sceneItemId)
+        sceneItemIds.append(sceneItemId)
+    return sceneItemIds
+
+def editAnimation_set_vis(props, settings):
+    # Swap the built groups for the newly edited animations' ones.
+    global editAnimation
+    editAnimation = obs.obs_data_get_int(settings, editAnimationStorage)
+    after = editedAnimations()
+    for i in builtAnimations.difference(after):
+        obs.obs_properties_remove_by_name(props, Animations[i].groupStorage)
+    builtAnimations.intersection_update(after)
+    added = [i for i in after if i not in builtAnimations]
+    if added:
+        videoSourceNames = findVideoSourceNames()
+        sceneNames = obs.obs_frontend_get_scene_names() or []
+        for i in added:
+            group = addAnimationProperties(props, Animations[i], videoSourceNames, sceneNames)
+            animationSettings_set_vis(group, Animations[i], settings)
     return True
 
-def animationProperties_set_vis(props, animation, variationType, movementType, showStartingProperties):
+def animationSettings_set_vis(props, animation, settings):
+    showStartingProperties = obs.obs_data_get_bool(settings, animation.customStartingSettingStorage)
+    variationType = obs.obs_data_get_int(settings, animation.variationTypeStorage)
+    movementType = obs.obs_data_get_int(settings, animation.movementTypeStorage)
+    easing = obs.obs_data_get_int(settings, animation.easingStorage)
+    springFollow = obs.obs_data_get_bool(settings, animation.springFollowStorage)
+    target = obs.obs_data_get_int(settings, animation.targetStorage)
+    animationProperties_set_vis(props, animation, variationType, movementType, showStartingProperties, easing, springFollow, target)
+
+def animationProperties_set_vis(props, animation, variationType, movementType, showStartingProperties, easing, springFollow, target):
     global settings
     # variationType = animation.variationType
     # movementType = animation.movementType
@@ -747,15 +2483,36 @@ def animationProperties_set_vis(props, animation, variationType, movementType, s
     else:
         obs.obs_property_set_visible(changeSizeInPlaceProperty, False)
 
+    freeMovement = variationType == VARIATION_POSITION_FREE or variationType == VARIATION_POSITION_FREE_ALL
+    for freeStorage in [animation.accelerationStorage, animation.decelerationStorage]:
+        obs.obs_property_set_visible(obs.obs_properties_get(props, freeStorage), freeMovement)
+
+    obs.obs_property_set_visible(obs.obs_properties_get(props, animation.targetSceneNameStorage), target == TARGET_SCENE)
+    obs.obs_property_set_visible(obs.obs_properties_get(props, animation.sceneItemIdStorage), target == TARGET_SCENE)
+
+    # Free movement has no target, so there is nothing to ease toward or spring to.
+    movesToTarget = variationType == VARIATION_POSITION or variationType == VARIATION_SIZE or variationType == VARIATION_BOTH
+    obs.obs_property_set_visible(obs.obs_properties_get(props, animation.springFollowStorage), movesToTarget)
+    for springStorage in [animation.springStiffnessStorage, animation.springDampingStorage]:
+        obs.obs_property_set_visible(obs.obs_properties_get(props, springStorage), movesToTarget and springFollow)
+
+    # A spring has no timeline to ease.
+    easesMovement = movesToTarget and not springFollow
+    obs.obs_property_set_visible(obs.obs_properties_get(props, animation.easingStorage), easesMovement)
+    for bezierStorage in [animation.bezierX1Storage, animation.bezierY1Storage, animation.bezierX2Storage, animation.bezierY2Storage]:
+        obs.obs_property_set_visible(obs.obs_properties_get(props, bezierStorage), easesMovement and easing == EASING_CUBIC_BEZIER)
+
     
 
 def check_Server():
     print("Check Server")
     Server.checkServer()
+    if Server.run:
+        TickTimer.start()
 
 def ping_Server():
     print("Ping Server")
-    Server.lastPingTime = time.clock()
+    Server.lastPingTime = time.monotonic()
 
 def restoreAnimations(settings):
     #print("Restoring Animation with new animation count of %s" % (animationCount))
@@ -776,6 +2533,18 @@ def restoreAnimations(settings):
         animation.movementType = obs.obs_data_get_int(settings, animation.movementTypeStorage)
         animation.duration = obs.obs_data_get_int(settings, animation.durationStorage)
         animation.posSpeed = obs.obs_data_get_int(settings, animation.posSpeedStorage)
+        animation.acceleration = obs.obs_data_get_int(settings, animation.accelerationStorage)
+        animation.deceleration = obs.obs_data_get_int(settings, animation.decelerationStorage)
+        animation.edgeBehavior = obs.obs_data_get_int(settings, animation.edgeBehaviorStorage)
+        animation.edgeMargin = obs.obs_data_get_int(settings, animation.edgeMarginStorage)
+        animation.springFollow = obs.obs_data_get_bool(settings, animation.springFollowStorage)
+        animation.springStiffness = obs.obs_data_get_double(settings, animation.springStiffnessStorage)
+        animation.springDamping = obs.obs_data_get_double(settings, animation.springDampingStorage)
+        animation.easing = obs.obs_data_get_int(settings, animation.easingStorage)
+        animation.bezierX1 = obs.obs_data_get_double(settings, animation.bezierX1Storage)
+        animation.bezierY1 = obs.obs_data_get_double(settings, animation.bezierY1Storage)
+        animation.bezierX2 = obs.obs_data_get_double(settings, animation.bezierX2Storage)
+        animation.bezierY2 = obs.obs_data_get_double(settings, animation.bezierY2Storage)
 
         # Get Destination Position and Scale
         animation.destinationX = obs.obs_data_get_int(settings, animation.destinationXStorage)
@@ -785,17 +2554,39 @@ def restoreAnimations(settings):
 
         animation.posDirection = obs.obs_data_get_int(settings, animation.posDirectionStorage)
         animation.changeSizeInPlace = obs.obs_data_get_bool(settings, animation.changeSizeInPlaceStorage)
+        animation.subPixel = obs.obs_data_get_bool(settings, animation.subPixelStorage)
+        animation.linked = obs.obs_data_get_bool(settings, animation.linkedStorage)
         animation.command = obs.obs_data_get_string(settings, animation.commandStorage)
         animation.stopCommand = obs.obs_data_get_string(settings, animation.stopCommandStorage)
+        animation.sourceName = obs.obs_data_get_string(settings, animation.sourceNameStorage)
+        animation.target = obs.obs_data_get_int(settings, animation.targetStorage)
+        animation.targetSceneName = obs.obs_data_get_string(settings, animation.targetSceneNameStorage)
+        if animation.target == TARGET_SCENE:
+            animation.sceneItemId = obs.obs_data_get_int(settings, animation.sceneItemIdStorage)
         Animations.append(animation)
+    CommandIndex.build(Animations)
+
+def script_defaults(settings):
+    """
+    Called to set default values of data settings.
+    """
+    for i in range(25):
+        animation = Animation(i)
+        obs.obs_data_set_default_double(settings, animation.bezierX1Storage, animation.bezierX1)
+        obs.obs_data_set_default_double(settings, animation.bezierY1Storage, animation.bezierY1)
+        obs.obs_data_set_default_double(settings, animation.bezierX2Storage, animation.bezierX2)
+        obs.obs_data_set_default_double(settings, animation.bezierY2Storage, animation.bezierY2)
+        obs.obs_data_set_default_double(settings, animation.springStiffnessStorage, animation.springStiffness)
+        obs.obs_data_set_default_double(settings, animation.springDampingStorage, animation.springDamping)
 
 def script_update(updatedSettings):
     """
     Called when the script’s settings (if any) have been changed by the user.
     """
     global source_name
-    global scene_item
     global animationCount
+    global tickFollowsCanvas
+    global editAnimation
     global Server
     global Animations
     global settings
@@ -810,6 +2601,13 @@ def script_update(updatedSettings):
         animationCount = obs.obs_data_get_int(settings, "animationCount")
         Server.address = obs.obs_data_get_string(settings, Server.addressStorage)
         Server.port = obs.obs_data_get_int(settings, Server.portStorage)
+        Server.batchedReceive = obs.obs_data_get_bool(settings, Server.batchedReceiveStorage)
+        Server.receiveBufferKB = obs.obs_data_get_int(settings, Server.receiveBufferStorage)
+        tickFollowsCanvas = obs.obs_data_get_bool(settings, tickFollowsCanvasStorage)
+        editAnimation = obs.obs_data_get_int(settings, editAnimationStorage)
+        Canvas.refresh()
+        Canvas.watch()
+        updateTickRate()
 
         restoreAnimations(settings)
 
@@ -826,12 +2624,13 @@ def script_update(updatedSettings):
         #         serverThreadFound = True
         #     break
 
-        Server.run = False
-        #Server.checkServer()
+        Server.restartServer()
 
-        Source.processingAnimation = False
-        obs.timer_remove(adjustCameraTick)
-        obs.timer_add(adjustCameraTick, UpdateRateMs)
+        # Targets may have changed, so drop every cached source and scene item.
+        Sources.clear()
+        SceneItems.clear()
+        CommandQueue.clear()
+        TickTimer.start()
 
         obs.timer_remove(check_Server)
         obs.timer_add(check_Server, 10000)
@@ -847,34 +2646,43 @@ def script_update(updatedSettings):
         print("Exception from script_update: %s" % (e))
 
 def frontend_event(data):
-    global scene_item
-    global source_name
-
     print("Shutdown - Data: %s" % (data))
     if data == 17:
-        Server.run = False
-        Server.forceCloseServerSocket()
-        Source.processingAnimation = False
-        obs.timer_remove(adjustCameraTick)
+        Server.stopServer()
+        TickTimer.stop()
         obs.timer_remove(ping_Server)
         obs.timer_remove(check_Server)
-
-        main_thread = threading.current_thread()
-        for t in threading.enumerate():
-            if t is main_thread or t.getName().startswith('Dummy'):
-                print('Main/Dummy Thread with name %s, id %s' % (t.getName(), t.ident))
-                continue
-            print('Thread with name %s, id %s' % (t.getName(), t.ident))
-            t.stop()
-            t.join()
         print("Finished joining thread.")
-        Server.thread = None
-        obs.obs_sceneitem_release(scene_item)
-        scene_item = None
-    elif data == 8:
-        if scene_item is not None:
-            #print("Before scene item release on shutdown data = 8")
-            #obs.obs_sceneitem_release(scene_item)
-            #scene_item = None
-            #print("After scene item release on shutdown data = 8")
-            scene_item = findSceneItem(source_name)
\ No newline at end of file
+        # Scene items from obs_scene_find_source are borrowed, so they are dropped rather than released.
+        Sources.clear()
+        SceneItems.clear()
+    elif data == obs.OBS_FRONTEND_EVENT_SCENE_CHANGED:
+        SceneItems.currentScene = findCurrentSceneName()
+        targets = [TARGET_PROGRAM, TARGET_ALL]
+        # Outside studio mode the preview is the program, so it changed too.
+        previewScene = findPreviewSceneName()
+        if previewScene != SceneItems.previewScene:
+            SceneItems.previewScene = previewScene
+            targets.append(TARGET_PREVIEW)
+        Sources.refreshSceneItems(targets)
+    elif data == obs.OBS_FRONTEND_EVENT_PREVIEW_SCENE_CHANGED or data == obs.OBS_FRONTEND_EVENT_STUDIO_MODE_ENABLED or data == obs.OBS_FRONTEND_EVENT_STUDIO_MODE_DISABLED:
+        SceneItems.previewScene = findPreviewSceneName()
+        Sources.refreshSceneItems([TARGET_PREVIEW])
+    elif data == obs.OBS_FRONTEND_EVENT_SCENE_LIST_CHANGED or data == obs.OBS_FRONTEND_EVENT_SCENE_COLLECTION_CHANGED or data == obs.OBS_FRONTEND_EVENT_FINISHED_LOADING:
+        # Scenes came or went; rebuild the index on the next lookup.
+        SceneItems.clear()
+        Sources.refreshSceneItems()
+    elif data == obs.OBS_FRONTEND_EVENT_SCENE_COLLECTION_CLEANUP:
+        # Every scene item is about to be freed.
+        Sources.clear()
+        SceneItems.clear()
+
+def script_unload():
+    """
+    Called when the script is removed or reloaded. Stopping here releases the
+    port right away instead of leaving the old server running until its ping lapses.
+    """
+    Server.stopServer()
+    TickTimer.stop()
+    Canvas.unwatch()
+    SceneItems.clear()